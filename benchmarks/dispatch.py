@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for get_type's per-node dispatch.
+
+Builds a large synthetic module and times how long it takes to pick the
+handler for every expression node, once with the isinstance ladder get_type
+used to have and once with the handler table it uses now. Also times a full
+run_through over the module for context.
+
+Usage: python benchmarks/dispatch.py [number of functions]
+"""
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import inquisition
+
+
+def synthetic_module(n_funcs):
+    lines = ["x = 1"]
+    for i in range(n_funcs):
+        lines.append("def f%d(a: int, b: float) -> float:" % i)
+        lines.append("    y = [a, 2, 3]")
+        lines.append("    z = {'k': a}")
+        lines.append("    w = a * 2 + 'bad'")
+        lines.append("    return a + b")
+        lines.append("f%d(x, 2.5)" % i)
+    return "\n".join(lines) + "\n"
+
+
+def ladder(expr):
+    """The isinstance chain get_type used before the handler table."""
+    if isinstance(expr, ast.FunctionDef):
+        return inquisition.get_func_type
+    elif isinstance(expr, ast.Call):
+        return inquisition.get_call_type
+    elif isinstance(expr, ast.Name):
+        return inquisition.get_name_type
+    elif isinstance(expr, ast.Assign):
+        return None
+    elif isinstance(expr, ast.Expr):
+        return inquisition.get_expr_type
+    elif isinstance(expr, ast.Str):
+        return None
+    elif isinstance(expr, ast.Num):
+        return None
+    elif isinstance(expr, ast.BinOp):
+        return inquisition.get_binop_type
+    elif isinstance(expr, ast.List):
+        return inquisition.get_list_type
+    elif isinstance(expr, ast.Dict):
+        return inquisition.get_dict_type
+    elif isinstance(expr, ast.If):
+        return None
+    elif isinstance(expr, ast.Pass):
+        return None
+    elif isinstance(expr, ast.ClassDef):
+        return inquisition.get_class_type
+    else:
+        return None
+
+
+def table(expr):
+    return inquisition.find_handler(inquisition.EXPR_HANDLERS, expr)
+
+
+def time_dispatch(dispatch, nodes, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for node in nodes:
+            dispatch(node)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(n_funcs):
+    code = ast.parse(synthetic_module(n_funcs))
+    nodes = [node for node in ast.walk(code) if isinstance(node, (ast.expr, ast.Expr))]
+
+    import warnings
+    with warnings.catch_warnings():
+        # ast.Str and ast.Num are deprecated, but that's what the ladder used
+        warnings.simplefilter("ignore", DeprecationWarning)
+        before = time_dispatch(ladder, nodes)
+    after = time_dispatch(table, nodes)
+
+    start = time.perf_counter()
+    inquisition.run_through(code.body, inquisition.Checker().module_env(),
+                            top_level=True, catch_errors=True)
+    full = time.perf_counter() - start
+
+    print("%d expression nodes" % len(nodes))
+    print("isinstance ladder: %7.1f ns/node" % (before / len(nodes) * 1e9))
+    print("handler table:     %7.1f ns/node" % (after / len(nodes) * 1e9))
+    print("full run_through:  %7.3f s" % full)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
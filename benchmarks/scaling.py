@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmarks for the checker.
+
+Generates modules that grow along one axis at a time, times run_through on
+each, and records peak memory. Results go to a JSON file that can be compared
+against the results of another commit:
+
+    python benchmarks/scaling.py -o before.json
+    ... change things ...
+    python benchmarks/scaling.py -o after.json --compare before.json
+
+A time that grows much faster than the size on some axis is the thing to look
+for.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import inquisition
+import streaming
+
+
+def gen_functions(n):
+    lines = []
+    for i in range(n):
+        lines.append("def f%d(a: int) -> int:" % i)
+        lines.append("    b = a + %d" % i)
+        lines.append("    return b * 2")
+    return lines
+
+
+def gen_nesting(n):
+    lines = []
+    for i in range(n):
+        lines.append("    " * i + "def f%d(a: int):" % i)
+        lines.append("    " * (i + 1) + "x%d = a + %d" % (i, i))
+    for i in reversed(range(n)):
+        lines.append("    " * (i + 1) + "return f%d" % (i + 1) if i + 1 < n else
+                     "    " * (i + 1) + "return x%d" % i)
+    return lines
+
+
+def gen_if_ladder(n):
+    lines = ["def f(a: int) -> int:", "    if a < 0:", "        return 0"]
+    for i in range(1, n):
+        lines.append("    elif a < %d:" % i)
+        lines.append("        return %d" % i)
+    lines.append("    else:")
+    lines.append("        return a")
+    return lines
+
+
+def gen_union_ladder(n):
+    # every branch returns a different type, built by wrapping 1 in lists
+    # and dicts according to the digits of the branch number
+    def value(i):
+        v = "1"
+        while i:
+            i, digit = divmod(i, 3)
+            v = ("[%s]", "{'k': %s}", "{1: %s}")[digit] % v
+        return v
+
+    lines = ["def f(a: int):", "    if a < 0:", "        return 0"]
+    for i in range(1, n):
+        lines.append("    elif a < %d:" % i)
+        lines.append("        return %s" % value(i))
+    lines.append("    else:")
+    lines.append("        return a")
+    return lines
+
+
+def gen_chain(n):
+    return ["a = 1", "b = " + " + ".join(["a"] * n)]
+
+
+def gen_literals(n):
+    return [
+        "xs = [%s]" % ", ".join(str(i) for i in range(n)),
+        "d = {%s}" % ", ".join("'k%d': %d" % (i, i) for i in range(n))
+    ]
+
+
+def gen_calls(n):
+    lines = ["def f(a: int, b: float) -> float:", "    return a + b"]
+    for i in range(n):
+        lines.append("f(%d, 1.5)" % i)
+    return lines
+
+
+def gen_classes(n):
+    lines = []
+    for i in range(n):
+        lines.append("class C%d():" % i)
+        lines.append("    y = %d" % i)
+        lines.append("    def __init__(self, a: int):")
+        lines.append("        z = a + 1")
+        lines.append("c%d = C%d(%d)" % (i, i, i))
+    return lines
+
+
+def gen_hierarchy(n):
+    lines = ["class C0():",
+             "    def m0(self, a: int) -> int:",
+             "        return a"]
+    for i in range(1, n):
+        lines.append("class C%d(C%d):" % (i, i - 1))
+        lines.append("    def m%d(self, a: int) -> int:" % i)
+        lines.append("        return self.m%d(a) + self.m0(a)" % (i - 1))
+    lines.append("x = C%d().m0(1)" % (n - 1))
+    return lines
+
+
+AXES = {
+    "functions": (gen_functions, [100, 200, 400, 800, 1600]),
+    "nesting": (gen_nesting, [5, 10, 20, 40, 80]),
+    "if_ladder": (gen_if_ladder, [25, 50, 100, 200, 400, 800, 1600]),
+    "unions": (gen_union_ladder, [25, 50, 100, 200]),
+    "chain": (gen_chain, [1000, 2000, 4000, 8000]),
+    "literals": (gen_literals, [1000, 4000, 16000, 64000]),
+    "calls": (gen_calls, [250, 500, 1000, 2000, 4000]),
+    "classes": (gen_classes, [50, 100, 200, 400, 800]),
+    "hierarchy": (gen_hierarchy, [50, 100, 200, 400, 800]),
+}
+
+
+def check(code):
+    return inquisition.run_through(code.body, inquisition.Checker().module_env(),
+                                   top_level=True, catch_errors=True)
+
+
+def measure(source, repeat):
+    """Times run_through alone; parsing isn't counted in time or memory."""
+    code = streaming.parse(source)
+    best = None
+    error = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            check(code)
+        except RecursionError:
+            error = "RecursionError"
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # separate run, since tracing slows everything down
+    tracemalloc.start()
+    try:
+        check(code)
+    except RecursionError:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"seconds": best, "peak_bytes": peak}
+    if error:
+        result["error"] = error
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(axes, repeat, scale):
+    results = {}
+    for name in axes:
+        gen, sizes = AXES[name]
+        results[name] = []
+        for size in sizes:
+            size = max(1, int(size * scale))
+            source = "\n".join(gen(size)) + "\n"
+            result = measure(source, repeat)
+            result["size"] = size
+            results[name].append(result)
+            print("%-10s %7d  %8.4fs  %8.1f KiB%s" %
+                  (name, size, result["seconds"], result["peak_bytes"] / 1024,
+                   "  " + result["error"] if "error" in result else ""))
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "results": results
+    }
+
+
+def compare(old, new):
+    print()
+    print("%-10s %7s  %10s  %10s" % ("axis", "size", "time", "memory"))
+    for name, rows in new["results"].items():
+        old_rows = {r["size"]: r for r in old["results"].get(name, [])}
+        for row in rows:
+            before = old_rows.get(row["size"])
+            if before is None:
+                continue
+            print("%-10s %7d  %9.2fx  %9.2fx" %
+                  (name, row["size"],
+                   row["seconds"] / before["seconds"] if before["seconds"] else 0,
+                   row["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else 0))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Checker scaling benchmarks.")
+    parser.add_argument("-o", "--output", default="bench_output.json",
+                        help="where to write results (default: %(default)s)")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="print time and memory ratios against earlier results")
+    parser.add_argument("--axis", action="append", choices=sorted(AXES),
+                        help="only run these axes (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timing runs per size, best is kept")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every size by this")
+    args = parser.parse_args(argv)
+
+    results = run(args.axis or sorted(AXES), args.repeat, args.scale)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
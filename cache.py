@@ -0,0 +1,109 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from pypes import LRUCache
+import typiary
+
+
+def fingerprint(version):
+    """
+    Hash of everything besides the source file that can change a check result:
+    the checker version and the builtin types and stubs in typiary.
+    """
+    h = hashlib.sha256(version.encode())
+    typiary_dir = os.path.dirname(typiary.__file__)
+    for root, dirs, names in os.walk(typiary_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(names):
+            if name.endswith((".py", ".pyi")):
+                path = os.path.join(root, name)
+                h.update(os.path.relpath(path, typiary_dir).encode())
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+class ResultCache():
+    """
+    On-disk cache of per-file results, keyed by the hash of the source plus
+    the checker fingerprint. Entries are written atomically so several worker
+    processes can share one directory.
+    """
+    directory = None
+    fingerprint = None
+
+    def __init__(self, directory, fingerprint):
+        self.directory = directory
+        self.fingerprint = fingerprint
+
+    def key(self, source):
+        h = hashlib.sha256(self.fingerprint.encode())
+        h.update(source)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pickle")
+
+    def get(self, key):
+        """
+        Returns the cached {errors, values} dict, or None on a miss. An entry
+        that can't be loaded, whatever the reason, is a miss too.
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        try:
+            data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # some inferred value can't be stored; just don't cache this file
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class MemoryCache(ResultCache):
+    """
+    A ResultCache that keeps the maxsize most recently used entries in memory
+    and, if there is a directory, every entry on disk as well. (A daemon
+    keeps one for as long as it runs, so it can't just grow.)
+    """
+    memory = None
+    maxsize = 8192
+
+    def __init__(self, directory=None, fingerprint="", maxsize=None):
+        ResultCache.__init__(self, directory, fingerprint)
+        self.memory = LRUCache(maxsize or self.maxsize)
+
+    def get(self, key):
+        try:
+            return self.memory[key]
+        except KeyError:
+            entry = None
+        if self.directory is not None:
+            entry = ResultCache.get(self, key)
+            if entry is not None:
+                self.memory[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        self.memory[key] = entry
+        if self.directory is not None:
+            ResultCache.put(self, key, entry)
+
+
+class FunctionCache(MemoryCache):
+    """
+    Cache of per-function summaries, keyed by the structure of a FunctionDef
+    and the types of the names it refers to.
+    """
+    maxsize = 65536
@@ -0,0 +1,36 @@
+# unannotated helpers get a return type for each kind of argument they're called with
+
+
+def double(x):
+    return x + x
+
+
+def half(x):
+    return x / 2
+
+
+def count_down(n):
+    if n:
+        return count_down(n - 1)
+    else:
+        return n
+
+
+a = double(2) + 1
+b = double("ab") + "c"
+c = double(2) + "c"  ##ERROR double(int) is an int
+d = half(3.0) + 1.5
+e = count_down(3) + 1
+f = double(half(2.0)) + "x"  ##ERROR float + str
+
+
+setting = 1
+
+
+def current(x):
+    return setting
+
+
+before = current(1)
+setting = "s"
+after = current(1) #:: int  ##ERROR setting is a str by now
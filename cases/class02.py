@@ -0,0 +1,155 @@
+class Shape():
+
+    sides = 0
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tags = [] #:: [str]
+
+    def area(self) -> float:
+        return 0.0
+
+    def describe(self, prefix: str) -> str:
+        return prefix + self.name
+
+    def grow(self, factor: float) -> float:
+        return self.area() * factor
+
+
+class Rect(Shape):
+
+    sides = 4
+
+    def __init__(self, w: float, h: float):
+        self.w = w
+        self.h = h
+
+    def area(self) -> float:
+        return self.w * self.h
+
+
+class Named():
+
+    def label(self) -> str:
+        return "named"
+
+    def broken(self) -> int:
+        return self.number  ##ERROR Named has no number
+
+
+class Square(Rect, Named):
+
+    @staticmethod
+    def unit() -> int:
+        return 1
+
+    @classmethod
+    def make(cls, side: float):
+        return cls(side, side)
+
+    @property
+    def side(self) -> float:
+        return self.w
+
+
+s = Square(2.0, 3.0)
+a = s.area() #:: float
+b = s.describe("square ") #:: str
+c = s.label() #:: str
+d = s.sides #:: int
+e = Square.unit() #:: int
+f = s.side #:: float
+g = Shape.area(s) #:: float
+t = Square.make(1.0)
+s.tags = ["big"]
+
+h = s.describe(1)  ##ERROR describe takes a str
+i = s.area(1)  ##ERROR area takes no arguments once bound
+j = s.volume()  ##ERROR no such method
+k = Square(1.0)  ##ERROR Rect's initializer takes two floats
+l = s.label() #:: int  ##ERROR label returns a str
+s.tags = [1]  ##ERROR tags are declared [str]
+Named(1)  ##ERROR no initializer, so no arguments
+
+
+def area_of(shape: Shape) -> float:
+    return shape.area()
+
+
+def first_rect(r: Rect) -> Rect:
+    return r
+
+
+m = first_rect(s)
+o = area_of(m) #:: float
+n = first_rect(Shape("blob"))  ##ERROR a Shape isn't a Rect
+
+
+class Base():
+    pass
+
+
+class Left(Base):
+    pass
+
+
+class Right(Base):
+    pass
+
+
+class Diamond(Left, Right):
+    pass
+
+
+class Bad(Base, Left):  ##ERROR no consistent MRO
+    pass
+
+
+class Err(Exception):
+
+    def code(self) -> int:
+        return 1
+
+
+x = Err("boom").message
+
+
+class Plain(object):
+
+    def ok(self) -> int:
+        return 1
+
+
+p = Plain().nope  ##ERROR object adds no attributes
+
+
+class Later():
+
+    def m(self) -> int:
+        return self.x
+
+    def n(self) -> str:
+        return self.x  ##ERROR x is an int
+
+    x = 1
+
+
+class Pair():
+
+    def __init__(self):
+        self.a, [self.b, *self.rest] = 1, [2, 3]
+        self.c: int = 3
+        self.count = 0
+        self.count += 1
+
+    def total(self) -> int:
+        return self.c
+
+    def kind(self):
+        return self.__class__
+
+
+q = Pair()
+r = (q.a, q.b, q.rest, q.__dict__, q.kind())
+u = q.c #:: int
+v = q.d  ##ERROR still no d
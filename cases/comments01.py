@@ -0,0 +1,14 @@
+# types declared in #:: comments
+
+
+names = [] #:: [str]
+count = 0 #:: int
+ratio = 1 #:: float  ##ERROR an int isn't a float
+label = "#:: int"
+scores = {'a': 1,
+          'b': 'two'} #:: {str: int}  ##ERROR 'two' isn't an int
+
+total = count + label  ##ERROR int + str
+
+pending = [] #:: [some.Thing]
+pending.append(1)
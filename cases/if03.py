@@ -0,0 +1,28 @@
+# elif ladders: every rung is checked, and the function returns what any
+# rung can
+
+
+def grade(score: int):
+    if score > 90:
+        return "A"
+    elif score > 80:
+        return "B"
+    elif score > 60:
+        return score
+    else:
+        return "F"
+
+
+g = grade(75) #:: str  ##ERROR might be an int
+n = 75
+
+if n > 90:
+    x = 1
+elif n > 80:
+    x = 2 + "2"  ##ERROR int + str
+elif n > 60:
+    x = n + 1
+else:
+    x = 4
+
+total = 1 + 2 + 3 + 4 + 5 + "6" + 7  ##ERROR int + str partway along
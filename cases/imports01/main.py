@@ -0,0 +1,10 @@
+import shapes
+from shapes.area import square
+from shapes import scale
+
+a = square(2.0)
+b = square("two")  ##ERROR str is not float
+c = shapes.unit() + 1
+d = scale.doubled(3.0)
+e = scale.missing(3)
+f = a + "x"  ##ERROR float + str
@@ -0,0 +1,5 @@
+from .area import square
+
+
+def unit() -> float:
+    return square(1.0)
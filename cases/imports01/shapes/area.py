@@ -0,0 +1,9 @@
+import shapes.scale
+
+
+def square(side: float) -> float:
+    return shapes.scale.factor() * side * side
+
+
+def broken() -> int:
+    return square(2.0)  ##ERROR float is not int
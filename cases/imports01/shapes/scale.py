@@ -0,0 +1,10 @@
+# imports area, which imports this module: the two are checked together
+from shapes import area
+
+
+def factor() -> float:
+    return 1.0
+
+
+def doubled(side: float) -> float:
+    return area.square(side) * 2.0
@@ -0,0 +1,22 @@
+# every element of a literal counts, not just the first
+
+
+def ints() -> [int]:
+    return [1,
+            2,
+            'three',  ##ERROR element should be int
+            4]
+
+
+def names() -> {str: int}:
+    return {'a': 1, 'b': 2.5}  ##ERROR value should be int
+
+
+def total(xs: [float]) -> float:
+    return 0.5
+
+
+total([1.5, 2.5])
+
+total([1.5,
+       None])  ##ERROR element should be float
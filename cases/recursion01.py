@@ -0,0 +1,50 @@
+# functions that use each other before they're defined get their real types
+
+
+def is_even(n: int):
+    if n:
+        return is_odd(n - 1)
+    else:
+        return True
+
+
+def is_odd(n: int):
+    if n:
+        return is_even(n - 1)
+    else:
+        return False
+
+
+def describe(n: int) -> str:
+    return label(n)  ##ERROR label returns an int
+
+
+def label(n: int):
+    return n * 2
+
+
+def countdown(n: int):
+    if n:
+        return countdown(n - 1)
+    else:
+        return 0
+
+
+a = is_even(4) #:: str  ##ERROR is_even returns a bool
+b = countdown(3) + 1
+c = countdown(3) + "x"  ##ERROR int + str
+
+
+def early(n):
+    return middle(1)
+
+
+def middle(n):
+    return late(n)
+
+
+def late(n: int):
+    return "s"
+
+
+d = middle(1) #:: int  ##ERROR specialized before late was inferred
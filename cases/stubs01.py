@@ -0,0 +1,37 @@
+import math
+from os import path
+
+print("checking", len([1, 2]))
+
+x = math.sqrt(2) + 1.5
+
+y = len("abc") + 'a'  ##ERROR can't add int to str
+
+math.floor("a")  ##ERROR no signature of floor takes a str
+
+path.join("a", "b", 3)  ##ERROR third argument should be a str
+
+
+class Base():
+
+    def __init__(self):
+        self.ready = True
+
+
+class Child(Base):
+
+    def __init__(self):
+        super(Child, self).__init__()
+
+
+def line():
+    return ""
+
+
+lines = iter(line, "")
+p = pow(2.0, 2) #:: float
+total = sum([1.0, 2])
+count = sum([1, 2]) #:: int
+text = str(b"x", "utf-8") #:: str
+made = type("Made", (), {})
+bad = sum([1, 2]) + "a"  ##ERROR the sum of ints is still an int
@@ -0,0 +1,5 @@
+import good
+
+
+def broken(:  ##ERROR not Python
+    pass
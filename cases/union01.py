@@ -0,0 +1,25 @@
+# a function whose branches return different types returns their union
+
+
+def pick(n: int):
+    if n:
+        return 1
+    else:
+        return "one"
+
+
+def same(n: int):
+    if n:
+        return 1
+    else:
+        return 2
+
+
+a = pick(1) #:: int  ##ERROR might be a str
+b = same(1) #:: int
+c = same(1) + 1
+d = pick(1) #:: float  ##ERROR neither fits
+
+
+def use(n: int) -> int:
+    return pick(n)  ##ERROR might return a str
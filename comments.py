@@ -1,17 +1,65 @@
-#!/bin/env python
-import ast
-import re
+"""
+Type annotations in comments, for code that can't use Python 3 annotations:
+
+    names = [] #:: [str]
 
-find_sig = re.compile('#::\s*(.*?)$') #:: re.pattern
+A #:: comment declares the type of the assignment that ends on its line.
+"""
+import ast
+import functools
+import io
+import tokenize
 
-def grab_types(f):
-    lines = f.readlines()
-    types = {} #::Map(int, str)
+MARKER = "#::"
 
-    for lineno, line in enumerate(lines):
-        match = find_sig.search(line)
-        if match:
-            annotation = match.groups()[0]
-            types[lineno] = ast.parse(annotation).body[0].value
 
+def grab_types(source):
+    """
+    Returns a dict of line number -> annotation expression for the #::
+    comments in source (bytes). The source is tokenized, so #:: inside a
+    string doesn't count.
+    """
+    types = {}
+    if MARKER.encode() not in source:
+        return types
+    try:
+        for token in tokenize.tokenize(io.BytesIO(source).readline):
+            if token.type == tokenize.COMMENT and token.string.startswith(MARKER):
+                annotation = parse_annotation(token.string[len(MARKER):].strip())
+                if annotation is not None:
+                    types[token.start[0]] = annotation
+    except (tokenize.TokenError, SyntaxError):
+        pass  # ast.parse has the better error message for this
     return types
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_annotation(annotation):
+    """
+    The expression in an annotation string, or None if it isn't one. The
+    same strings come up over and over, so each is only parsed once; the
+    result is shared and mustn't be changed.
+    """
+    try:
+        return ast.parse(annotation, mode="eval").body
+    except SyntaxError:
+        return None
+
+
+def attach(stmts, types):
+    """
+    Sets comment_annotation on every assignment in stmts (including nested
+    bodies) that has a #:: comment on its last line.
+    """
+    if not types:
+        return
+    todo = list(stmts)
+    while todo:
+        stmt = todo.pop()
+        if isinstance(stmt, ast.Assign):
+            annotation = types.get(stmt.end_lineno)
+            if annotation is not None:
+                stmt.comment_annotation = annotation
+            continue
+        for field in ("body", "orelse", "finalbody", "handlers"):
+            todo.extend(getattr(stmt, field, ()))
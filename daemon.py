@@ -0,0 +1,130 @@
+"""
+A long-running checker that answers requests over a Unix domain socket, so
+that a pre-commit hook doesn't pay for interpreter startup, imports, and
+re-checking unchanged files on every run.
+
+The protocol is one JSON object per line. The client sends
+
+    {"paths": ["/abs/path/a.py", ...]}
+
+and the server checks them together, as one run would, following the
+imports between them. It answers with one line per file, in the order they
+were checked (a module after the ones it imports),
+
+    {"path": "...", "errors": [[line, column, kind, message], ...],
+     "functions_reused": n, "functions_rechecked": m}
+
+followed by {"done": true}, or {"failure": "..."} and {"done": true} if the
+files couldn't be checked, for whatever reason. A client that sees a failure,
+or no {"done": true} at all, fails. {"shutdown": true} stops the server.
+"""
+import json
+import os
+import socket
+import socketserver
+import tempfile
+
+from diagnostics import Diagnostic
+
+
+def default_socket_path():
+    return os.path.join(tempfile.gettempdir(), "inquisition-%d.sock" % os.getuid())
+
+
+class CheckHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode())
+        if request.get("shutdown"):
+            self._send({"done": True})
+            self.server.shutdown_requested = True
+            return
+
+        try:
+            try:
+                for result in self.server.check(request["paths"]):
+                    self._send({
+                        "path": result['path'],
+                        "errors": [d[1:] for d in result['errors']],
+                        "functions_reused": result['functions_reused'],
+                        "functions_rechecked": result['functions_rechecked']
+                    })
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                # whatever it is, the client has to hear of it, or it would
+                # take the results so far for the whole answer
+                self._send({"failure": "%s: %s" % (e.__class__.__name__, e)})
+            self._send({"done": True})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading, e.g. at --max-errors
+
+    def _send(self, obj):
+        self.wfile.write((json.dumps(obj) + "\n").encode())
+
+
+class CheckServer(socketserver.UnixStreamServer):
+    """Requests are handled one at a time, in the order they come in."""
+    shutdown_requested = False
+    check = None
+
+
+def serve(socket_path, check):
+    """
+    Serves check requests until asked to shut down. check(paths) should
+    yield a check_file result for each of paths, like Checker.check_files;
+    it's expected to hold on to whatever makes
+    re-checks fast (parsed modules, cached results, function summaries).
+    """
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = CheckServer(socket_path, CheckHandler)
+    server.check = check
+    try:
+        while not server.shutdown_requested:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def _request(socket_path, obj):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps(obj) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            reply = json.loads(line.decode())
+            if reply.get("done"):
+                return
+            yield reply
+    raise RuntimeError("The daemon at %s closed the connection without finishing"
+                       % socket_path)
+
+
+def check_files(socket_path, files):
+    """
+    Asks the daemon to check files. Yields results shaped like
+    Checker.check_file's, in the order Checker.check_files would.
+    """
+    paths = [os.path.abspath(f) for f in files]
+    given = dict(zip(paths, files))
+    replies = _request(socket_path, {"paths": paths})
+    for reply in replies:
+        if "failure" in reply:
+            raise RuntimeError(reply["failure"])
+        f = given[reply["path"]]
+        yield {
+            "path": f,
+            "errors": [Diagnostic(f, *d) for d in reply["errors"]],
+            "functions_reused": reply["functions_reused"],
+            "functions_rechecked": reply["functions_rechecked"]
+        }
+    # read up to the end of the reply so the server isn't cut off
+    for _ in replies:
+        pass
+
+
+def shutdown(socket_path):
+    for _ in _request(socket_path, {"shutdown": True}):
+        pass
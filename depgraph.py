@@ -0,0 +1,177 @@
+"""
+The import graph of the modules being checked, so that a module can be checked
+after the modules it imports, against the types they export.
+
+Module names come from file paths: a file's name is its path relative to the
+first directory above it that isn't a package (has no __init__.py), the way
+Python would find it if that directory were on sys.path. Only imports of other
+files being checked are edges; everything else is left to the stubs.
+"""
+import ast
+import os
+
+import streaming
+
+
+def module_names(files):
+    """Returns a dict of path -> dotted module name for each file."""
+    names = {}
+    for path in files:
+        directory, filename = os.path.split(os.path.abspath(path))
+        parts = [] if filename == "__init__.py" else [filename[:-3]]
+        while os.path.exists(os.path.join(directory, "__init__.py")):
+            directory, package = os.path.split(directory)
+            parts.insert(0, package)
+        names[path] = ".".join(parts)
+    return names
+
+
+def package_of(path, name):
+    """The package that relative imports in module name are relative to."""
+    if os.path.basename(path) == "__init__.py":
+        return name
+    return name.rpartition(".")[0]
+
+
+def absolute_module(module, level, package):
+    """
+    The module that "from <level dots><module> import ..." refers to, or None
+    if it goes above the top-level package.
+    """
+    if not level:
+        return module
+    if not package:
+        return None  # a top-level module has nothing to be relative to
+    parts = package.split(".")
+    if level - 1 >= len(parts):
+        return None
+    parts = parts[:len(parts) - (level - 1)]
+    if module:
+        parts.append(module)
+    return ".".join(parts) or None
+
+
+def scan_imports(path, name, low_memory=False, cache=None):
+    """
+    The absolute names of every module path might import, anywhere in it:
+    imported modules, the packages above them, and for "from m import x", m.x
+    in case x is a submodule. With low_memory, the file is read a statement
+    at a time (see streaming.py). With a cache (a cache.ResultCache), the
+    names are kept under the hash of the file's contents, so an unchanged
+    file isn't parsed for them again.
+    """
+    package = package_of(path, name)
+    found = set()
+    key = None
+    try:
+        if low_memory:
+            for _, stmts in streaming.statements(path):
+                _scan(stmts, package, found)
+        else:
+            with open(path, 'rb') as f:
+                source = f.read()
+            if b"import" not in source:
+                return []
+            if cache is not None:
+                # relative imports depend on the package as well
+                key = cache.key(b"imports:" + (package or "").encode() + b"\0" + source)
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+            _scan(streaming.parse(source, path).body, package, found)
+    except (SyntaxError, UnicodeDecodeError, RecursionError, MemoryError):
+        return sorted(found)  # checking the file will fail, and say why
+    found = sorted(found)
+    if key is not None:
+        cache.put(key, found)
+    return found
+
+
+def _scan(stmts, package, found):
+
+    def add(module):
+        parts = module.split(".")
+        for i in range(1, len(parts) + 1):
+            found.add(".".join(parts[:i]))
+
+    # imports are statements, so there's no need to look inside expressions
+    todo = list(stmts)
+    while todo:
+        stmt = todo.pop()
+        if isinstance(stmt, ast.Import):
+            for alias in stmt.names:
+                add(alias.name)
+        elif isinstance(stmt, ast.ImportFrom):
+            module = absolute_module(stmt.module, stmt.level, package)
+            if module is None:
+                continue
+            add(module)
+            for alias in stmt.names:
+                if alias.name != "*":
+                    found.add(module + "." + alias.name)
+        else:
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                todo.extend(getattr(stmt, field, ()))
+
+
+def dependency_graph(names, scanned):
+    """
+    Given names from module_names and the scan_imports result for each path
+    (in the same order), returns a dict of path -> paths it imports.
+    """
+    by_name = {}
+    for path, name in names.items():
+        by_name.setdefault(name, path)
+    graph = {}
+    for (path, name), imported in zip(names.items(), scanned):
+        graph[path] = [by_name[m] for m in imported
+                       if m in by_name and by_name[m] != path]
+    return graph
+
+
+def strongly_connected(graph):
+    """
+    Tarjan's algorithm, with an explicit stack so deep import chains don't
+    hit the recursion limit. Returns the strongly connected components of
+    graph as lists of nodes, every component after the ones it depends on.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(node):
+        index[node] = low[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(graph[node]))
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [visit(root)]
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if dep not in index:
+                    work.append(visit(dep))
+                    break
+                if dep in on_stack:
+                    low[node] = min(low[node], index[dep])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    component.reverse()
+                    components.append(component)
+    return components
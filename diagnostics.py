@@ -0,0 +1,60 @@
+from collections import namedtuple
+
+
+class Diagnostic(namedtuple("Diagnostic", "path line column kind message")):
+    """
+    A type error detached from the AST node it was found on, so that it can be
+    sent between processes and sorted without keeping the tree alive.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_error(cls, path, e, line_offset=0):
+        ast_obj = e.ast_obj
+        return cls(path,
+                   getattr(ast_obj, "lineno", 0) + line_offset,
+                   getattr(ast_obj, "col_offset", 0),
+                   e.__class__.__name__,
+                   e.message)
+
+    def sort_key(self):
+        return (self.path, self.line, self.column, self.message)
+
+    def __str__(self):
+        return "%d: %s" % (self.line, self.message)
+
+
+class TooManyErrors(Exception):
+    """Raised by an ErrorSink that has taken its max_errors diagnostics."""
+
+
+class ErrorSink():
+    """
+    Collects a file's errors as run_through catches them. Each is turned into
+    a Diagnostic right away and passed to emit, if there is one, so that it
+    can be written out before the rest of the file is checked. line_offset
+    is added to the errors' line numbers, for trees that were parsed from
+    part of the file.
+    """
+    def __init__(self, path, emit=None, max_errors=None):
+        self.path = path
+        self.emit = emit
+        self.max_errors = max_errors
+        self.line_offset = 0
+        self.diagnostics = []
+
+    def add(self, e):
+        self.put(Diagnostic.from_error(self.path, e, self.line_offset))
+
+    def put(self, d):
+        self.diagnostics.append(d)
+        if self.emit is not None:
+            self.emit(d)
+        if self.max_errors is not None and len(self.diagnostics) >= self.max_errors:
+            raise TooManyErrors()
+
+    def __len__(self):
+        return len(self.diagnostics)
+
+    def __iter__(self):
+        return iter(self.diagnostics)
@@ -1,20 +1,72 @@
+# returned by Env.find for unbound names, since None is a valid type
+MISSING = object()
+
+
 # maps variable names to their types
 class Env():
-    parent = None
-    values = {}
+    """
+    One scope. Every Env knows its depth and keeps, besides its parent, a
+    jump pointer to an ancestor further up (a skew-binary ladder), so that a
+    name the resolver has tied to a scope (see resolver.py) is found in a
+    logarithmic number of hops rather than by walking up through every parent,
+    while each scope stays the same size however deep it is.
+    defs remembers which names a def statement bound, and to which node.
+    check is the state of the check the scope belongs to (an
+    inquisition.FileCheck), passed down from the module scope to every scope
+    inside it, so that one process can check several files at once.
+    """
+    __slots__ = ('parent', 'values', 'depth', 'jump', 'defs', 'check')
 
-    def __init__(self, values=None, parent=None):
+    def __init__(self, values=None, parent=None, check=None):
         self.parent = parent
-        if isinstance(values, dict):
-            self.values = values
+        # every scope gets its own dict; never share a default between them
+        self.values = values if values is not None else {}
+        self.defs = None
+        if parent is None:
+            self.depth = 0
+            self.jump = self
+        else:
+            self.depth = parent.depth + 1
+            jump = parent.jump
+            if parent.depth - jump.depth == jump.depth - jump.jump.depth:
+                self.jump = jump.jump
+            else:
+                self.jump = parent
+            if check is None:
+                check = parent.check
+        self.check = check
+
+    def ancestor(self, depth):
+        """Returns the enclosing scope (or self) at the given depth."""
+        env = self
+        while env.depth > depth:
+            if env.jump.depth >= depth:
+                env = env.jump
+            else:
+                env = env.parent
+        return env
+
+    def find(self, name, hops=None):
+        """
+        Returns the type of name, or MISSING. hops is how many scopes up the
+        resolver says name is bound; if it isn't bound there (yet), the outer
+        scopes are searched as usual.
+        """
+        env = self
+        if hops is not None and hops <= self.depth:
+            env = self.ancestor(self.depth - hops)
+        while env is not None:
+            t = env.values.get(name, MISSING)
+            if t is not MISSING:
+                return t
+            env = env.parent
+        return MISSING
 
     def lookup(self, name):
-        if name in self.values:
-            return self.values[name]
-        elif self.parent is not None:
-            return self.parent.lookup(name)
-        else:
+        t = self.find(name)
+        if t is MISSING:
             return None
+        return t
 
     def __getitem__(self, name):
         return self.lookup(name)
@@ -26,15 +78,33 @@ class Env():
             return None
 
     def __contains__(self, x):
-        if x in self.values:
-            return True
-        elif self.parent is not None:
-            return x in self.parent
-        else:
-            return False
+        return self.find(x) is not MISSING
 
     def add(self, k, v):
         self.values[k] = v
+        if self.defs is not None:
+            self.defs.pop(k, None)
+
+    def define(self, k, v, node):
+        """Binds k to v, remembering that it was bound by the def node."""
+        self.values[k] = v
+        if self.defs is None:
+            self.defs = {}
+        self.defs[k] = node
+
+    def find_definition(self, name):
+        """
+        Returns (def node, Env it was run in) for the function that name is
+        bound to, or None if name wasn't bound by a def.
+        """
+        frame = self
+        while frame is not None:
+            if name in frame.values:
+                if frame.defs is not None and name in frame.defs:
+                    return frame.defs[name], frame
+                return None
+            frame = frame.parent
+        return None
 
     def extend(self):
         return Env(parent=self)
@@ -1,22 +1,54 @@
 #!/usr/bin/env python3
 
+import argparse
 import ast
+import builtins as python_builtins
+import contextlib
+import functools
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.pool
 import os
+import pickle
+import queue
 import sys
+import threading
+import time
+import types
 
 
-from env import Env
+from cache import FunctionCache, MemoryCache, ResultCache, fingerprint
+import comments
+import daemon
+import depgraph
+from diagnostics import Diagnostic, ErrorSink, TooManyErrors
+from env import Env, MISSING
 import pypes
+import resolver
+import streaming
+from stats import Stats
+import stats
 from pypes import Heresy, Suspicion
 from typiary import builtins
+from typiary.stubs import StubLibrary
 
-DEBUG_LEVEL = 0
+__version__ = "0.1.1"
+
+# how many times sibling functions are re-inferred before giving up on a
+# fixpoint by default, see Siblings
+MAX_FIXPOINT_ROUNDS = 5
+
+# how many specializations may be in progress inside each other
+MAX_SPECIALIZATION_DEPTH = 3
 
 
 # map ast binop objects to python methods
 BINOPS = {
     "Add": "__add__",
-    "Mult": "__mul__"
+    "Sub": "__sub__",
+    "Mult": "__mul__",
+    "Div": "__truediv__"
 }
 
 # map these constants to their types so that we don't interpret them as vars
@@ -27,6 +59,10 @@ CONSTANTS = {
     "False": "bool"
 }
 
+# names Python itself provides, like the exception classes, which a class
+# in the checked code may inherit from without the stubs describing them
+PYTHON_BUILTINS = frozenset(dir(python_builtins))
+
 
 class LazyError(Exception):
     ast_obj = None
@@ -42,199 +78,1213 @@ class LazyError(Exception):
         return str(self.ast_obj.lineno) + ": " + self.message
 
 
-def main(f):
-    contents = open(f, 'r').read()
-    code = ast.parse(contents, filename=f)
+# AST node class -> handler; see expr_handler and stmt_handler
+EXPR_HANDLERS = {}
+STMT_HANDLERS = {}
+
+
+def expr_handler(*node_types):
+    """
+    Registers f(expr, env) as the way get_type finds the type of the given
+    node types. Extensions can use it to teach the checker new kinds of nodes.
+    """
+    def register(f):
+        for node_type in node_types:
+            EXPR_HANDLERS[node_type] = f
+        return f
+    return register
+
+
+def stmt_handler(*node_types):
+    """
+    Registers f(stmt, env, run) as the way run_through checks the given
+    statement types. run holds run_through's flags and the "errors" and
+    "returns" it is accumulating, which the handler updates in place.
+    Statements with no handler are passed to get_type.
+    """
+    def register(f):
+        for node_type in node_types:
+            STMT_HANDLERS[node_type] = f
+        return f
+    return register
+
+
+def instrument(wrap, tables=(EXPR_HANDLERS, STMT_HANDLERS)):
+    """
+    Replaces each registered handler f with wrap(node_type, f), e.g. to trace
+    or time every node without slowing down runs that don't ask for it.
+    """
+    for table in tables:
+        for node_type, f in list(table.items()):
+            table[node_type] = wrap(node_type, f)
+
+
+def find_handler(table, node):
+    node_type = type(node)
+    try:
+        return table[node_type]
+    except KeyError:
+        pass
+    # fall back to a handler registered for a base class
+    for base in node_type.__mro__[1:]:
+        if base in table:
+            table[node_type] = table[base]
+            return table[base]
+    return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Type check Python files.")
+    parser.add_argument("paths", nargs="*", metavar="path",
+                        help="files or directories to check")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--threads", action="store_true",
+                        help="use --jobs threads of this process instead of worker processes")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="reuse results of unchanged files from DIR")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and check files sent over --socket")
+    parser.add_argument("--connect", action="store_true",
+                        help="have the daemon listening on --socket check the files")
+    parser.add_argument("--stop-daemon", action="store_true",
+                        help="stop the daemon listening on --socket")
+    parser.add_argument("--socket", default=daemon.default_socket_path(),
+                        help="Unix socket of the daemon (default: %(default)s)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print where checking time goes")
+    parser.add_argument("--stats-stacks", metavar="FILE",
+                        help="with --stats, write collapsed stacks for flame graphs")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text",
+                        help="text, or one JSON object per diagnostic (default: %(default)s)")
+    parser.add_argument("--max-errors", type=int, metavar="N",
+                        help="stop checking after N errors")
+    parser.add_argument("--lazy", action="store_true",
+                        help="only check function bodies that are used")
+    parser.add_argument("--entry", action="append", metavar="NAME",
+                        help="with --lazy, also check top-level function NAME")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="check a statement at a time; report each file's peak memory")
+    parser.add_argument("--max-union", type=int, default=pypes.MAX_UNION_SIZE, metavar="N",
+                        help="widen unions of more than N types (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.max_errors is not None and args.max_errors < 1:
+        parser.error("--max-errors must be at least 1")
+    if args.max_union < 2:
+        parser.error("--max-union must be at least 2")
+
+    if args.entry and not args.lazy:
+        parser.error("--entry only makes sense with --lazy")
+    if args.low_memory and args.lazy:
+        parser.error("--lazy keeps every function's tree, so it can't be --low-memory")
+    if args.threads and args.low_memory:
+        parser.error("--low-memory needs a process per file to measure its memory")
+    if args.threads and args.stats:
+        parser.error("--stats times the whole process, so it can't be used with --threads")
+    # DEBUG=n in the environment prints what the check is doing
+    debug_level = int(os.environ.get('DEBUG', 0))
+    settings = dict(debug_level=debug_level, with_stats=args.stats,
+                    max_union=args.max_union)
+
+    # the union size changes the types inferred, so cached ones can't be shared
+    key = fingerprint("%s;max-union:%d" % (__version__, args.max_union))
+    cache = function_cache = None
+    if args.cache_dir:
+        cache = ResultCache(args.cache_dir, key)
+        function_cache = FunctionCache(os.path.join(args.cache_dir, "functions"), key)
+
+    if args.stop_daemon:
+        daemon.shutdown(args.socket)
+        return
+    if args.daemon:
+        # keep everything in memory, backed by --cache-dir if there is one
+        if function_cache is None:
+            function_cache = FunctionCache(fingerprint=key)
+        checker = Checker(args.lazy, args.entry or (), function_cache=function_cache,
+                          **settings)
+        results = MemoryCache(args.cache_dir, key)
+        daemon.serve(args.socket, functools.partial(checker.check_files, cache=results))
+        return
+    if not args.paths:
+        parser.error("no files to check")
+
+    files = collect_files(args.paths)
+    show_path = len(files) > 1
+
+    # sys.stdout is block buffered when it isn't a terminal, e.g. in CI
+    out = sys.stdout
+    if args.format == "jsonl":
+        # streamed as they are found
+        def emit(d):
+            out.write(json.dumps(d._asdict()) + "\n")
+        show = None
+    else:
+        # a file at a time, by line, the same however the files are checked
+        emit = None
+        if show_path:
+            def show(d):
+                out.write("%s:%s\n" % (d.path, d))
+        else:
+            def show(d):
+                out.write("%s\n" % (d,))
+
+    if args.connect:
+        results = limit_errors(daemon.check_files(args.socket, files),
+                               emit, args.max_errors)
+    else:
+        checker = Checker(args.lazy, args.entry or (), args.low_memory, function_cache,
+                          **settings)
+        results = checker.check_files(files, args.jobs, cache, emit, args.max_errors,
+                                      args.threads)
+
+    checked = errors = reused = rechecked = 0
+    stats_total = stats.empty()
+    start = time.perf_counter()
+    for result in results:
+        checked += 1
+        errors += len(result['errors'])
+        if show is not None:
+            for d in result['errors']:
+                show(d)
+        reused += result['functions_reused']
+        rechecked += result['functions_rechecked']
+        if 'peak_rss_kib' in result:
+            print("%s: peak RSS +%.1f MiB" % (result['path'], result['peak_rss_kib'] / 1024),
+                  file=sys.stderr)
+        if 'stats' in result:
+            stats.merge(stats_total, result['stats'])
+    elapsed = time.perf_counter() - start
+    out.flush()
+
+    if args.max_errors is not None and errors >= args.max_errors:
+        print("Stopped after %d errors" % errors, file=sys.stderr)
+    print("Checked %d files in %.2fs (%.1f files/sec)" %
+          (checked, elapsed, checked / elapsed if elapsed else 0.0),
+          file=sys.stderr)
+    if function_cache is not None or args.connect:
+        print("Function bodies: %d reused, %d re-checked" % (reused, rechecked),
+              file=sys.stderr)
+    if args.stats:
+        # the workers' numbers don't include what they started out with
+        stats_total['peak_rss_kib'] = max(stats_total['peak_rss_kib'], stats.peak_rss_kib())
+        stats.report(stats_total, sys.stderr)
+        if args.stats_stacks:
+            with open(args.stats_stacks, 'w') as f:
+                stats.write_stacks(stats_total, f)
+
+
+def collect_files(paths):
+    """
+    Expands directories into the .py files underneath them. The result is in a
+    fixed order so that output doesn't depend on the filesystem.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.endswith(".py"):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+    return files
+
+
+class Checker():
+    """
+    Everything a check depends on besides the files themselves: the options,
+    the builtins, and what is shared between the files it checks (the
+    function cache and the specializations of functions). One Checker can
+    check any number of files, including several at once in threads; the
+    state of each file's check is its FileCheck.
+
+    lazy: function bodies are only checked once something needs them;
+    entries are top-level functions to check regardless.
+    low_memory: files are read and checked a statement at a time.
+    function_cache: summaries of already-checked function bodies, see
+    get_func_type_for_real.
+    debug_level: how much to print about the check (0 for nothing).
+    with_stats: time the check, see stats.Stats; each result has the numbers.
+    max_union: unions of more types than this are widened, see pypes.SomeType.
+    max_fixpoint_rounds: see Siblings.
+    """
+    def __init__(self, lazy=False, entries=(), low_memory=False, function_cache=None,
+                 debug_level=0, with_stats=False, max_union=pypes.MAX_UNION_SIZE,
+                 max_fixpoint_rounds=MAX_FIXPOINT_ROUNDS):
+        self.lazy = lazy
+        self.entries = tuple(entries)
+        self.low_memory = low_memory
+        self.function_cache = function_cache
+        self.debug_level = debug_level
+        if debug_level > 2:
+            trace_handlers()
+        self.stats = None
+        if with_stats:
+            self.stats = Stats()
+            stats.instrument(sys.modules[__name__])
+        self.max_union = max_union
+        self.max_fixpoint_rounds = max_fixpoint_rounds
+        # (def node, Env, argument types, types of the names it uses,
+        # generation) -> return type, see specialize
+        self.specializations = pypes.LRUCache(4096)
+        self.builtins = builtin_env()
+
+    def options(self):
+        """What it takes to make an equivalent Checker, e.g. in a worker."""
+        return (self.lazy, self.entries, self.low_memory, self.function_cache,
+                self.debug_level, self.stats is not None, self.max_union,
+                self.max_fixpoint_rounds)
+
+    def module_env(self, f=None, module=None, imports=None):
+        """
+        A fresh scope for the top level of file f, on top of the builtins.
+        module is its module name and imports the exports of the modules from
+        the checked tree that it imports, by module name.
+        """
+        check = FileCheck(self)
+        for name, values in sorted((imports or {}).items()):
+            check.local_modules[name] = pypes.ModuleType(name, values,
+                                                         version=exports_digest(values))
+        if module is not None:
+            check.package = depgraph.package_of(f, module)
+        return Env({}, parent=self.builtins, check=check)
+
+    def check_files(self, files, jobs=1, cache=None, emit=None, max_errors=None,
+                    threads=False):
+        """
+        Yields the check_file result of each file. Imports between the files
+        are followed: each module is checked after the ones it imports, so
+        results come in dependency order (which is fixed, given files).
+        Files are spread over a process pool when there's more than one job,
+        or over a pool of threads with threads.
+        Each diagnostic is passed to emit as soon as it reaches this process:
+        when it's found with one job, when its module is done with more.
+        Checking stops once there have been max_errors.
+        """
+        names = depgraph.module_names(files)
+        jobs = min(jobs, len(files))
+        # with --low-memory, every file gets a fresh process so its peak RSS is its own
+        if jobs <= 1 and not self.low_memory:
+            graph = depgraph.dependency_graph(
+                names, [depgraph.scan_imports(path, name, cache=cache)
+                        for path, name in names.items()])
+            exports = {}
+            for component in depgraph.strongly_connected(graph):
+                members = [(path, names[path]) for path in component]
+                results = self.check_component(
+                    members, _imports_of(component, graph, names, exports),
+                    cache, emit, max_errors)
+                for path, result in zip(component, results):
+                    exports[path] = result['exports']
+                    yield result
+                    if max_errors is not None:
+                        max_errors -= len(result['errors'])
+                        if max_errors <= 0:
+                            return
+            return
+
+        if threads:
+            pool = multiprocessing.pool.ThreadPool(max(jobs, 1))
+            check_component = self.check_component
+        else:
+            pool = multiprocessing.Pool(max(jobs, 1), initializer=_init_worker,
+                                        initargs=self.options(),
+                                        maxtasksperchild=1 if self.low_memory else None)
+            check_component = _check_component
+        with pool:
+            chunksize = max(1, len(files) // (jobs * 8))
+            scanned = pool.starmap(depgraph.scan_imports,
+                                   [(path, name, self.low_memory, cache)
+                                    for path, name in names.items()],
+                                   chunksize)
+            graph = depgraph.dependency_graph(names, scanned)
+            # leaving the with block stops the workers still checking
+            yield from limit_errors(
+                _schedule(pool, check_component, graph, names, cache, max_errors),
+                emit, max_errors)
+
+    def check_component(self, members, imports, cache=None, emit=None, max_errors=None):
+        """
+        Checks a strongly connected set of modules, given as (path, module
+        name) pairs, against the exports of the modules outside it that they
+        import. Returns their check_file results in the same order.
+        Modules that import each other are checked twice: first with each
+        other's exports unknown, to find out what they are, then for real.
+        """
+        if len(members) > 1:
+            round_one = dict(imports)
+            round_one.update((name, {}) for path, name in members)
+            first = {}
+            for path, name in members:
+                first[name] = self.check_file(path, cache, module=name,
+                                              imports=round_one)['exports']
+            imports = dict(imports, **first)
+
+        results = []
+        for path, name in members:
+            result = self.check_file(path, cache, emit, max_errors, name, imports)
+            results.append(result)
+            if max_errors is not None:
+                max_errors -= len(result['errors'])
+                if max_errors <= 0:
+                    break
+        return results
+
+    def check_file(self, f, cache=None, emit=None, max_errors=None, module=None,
+                   imports=None, contents=None):
+        """
+        Checks one file with a fresh Env. Returns a dict of its path, its
+        diagnostics sorted by line, its top-level names and their types
+        ("exports"), and
+        how many function bodies were reused from or re-checked into the
+        function cache. With a cache, an unchanged file is not parsed at all.
+        Diagnostics are also passed to emit as they are found, and checking
+        stops at max_errors; a file that was cut short isn't cached.
+        module is the file's module name, and imports holds the exports of
+        the modules from the checked tree that it imports, by module name.
+        contents, if given, is used instead of reading f again.
+        With low_memory, the file is never read or parsed as a whole (so
+        there's no caching either), and the result has how much the process'
+        peak RSS grew (see stats.mark_rss).
+        """
+        with self.running():
+            return self._check_file(f, cache, emit, max_errors, module, imports, contents)
+
+    @contextlib.contextmanager
+    def running(self):
+        """
+        Makes this Checker's settings the ones that checks in this thread read
+        where there's no Env to find the Checker through: in pypes and stats.
+        """
+        tokens = [(pypes.max_union_size, pypes.max_union_size.set(self.max_union)),
+                  (pypes.debug_level, pypes.debug_level.set(self.debug_level)),
+                  (stats.current, stats.current.set(self.stats))]
+        try:
+            yield
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
+
+    def _check_file(self, f, cache, emit, max_errors, module, imports, contents):
+        if self.low_memory:
+            cache = None
+        elif contents is None:
+            with open(f, 'rb') as source:
+                contents = source.read()
+
+        sink = ErrorSink(f, emit, max_errors)
+        env = self.module_env(f, module, imports)
+
+        if cache is not None:
+            # the result depends on what the file imports, not just its contents
+            stamp = ["%s:%s;" % (name, module_t.version)
+                     for name, module_t in sorted(env.check.local_modules.items())]
+            if module is not None:
+                stamp.append("module:%s" % module)
+            if self.lazy:
+                stamp.append("lazy:%s" % ",".join(self.entries))
+            key = cache.key(contents + "".join(stamp).encode())
+            entry = cache.get(key)
+            if entry is not None:
+                try:
+                    for d in entry['errors']:
+                        sink.put(Diagnostic(f, *d))
+                except TooManyErrors:
+                    pass
+                return {
+                    "path": f,
+                    "errors": sorted(sink, key=Diagnostic.sort_key),
+                    "exports": entry['values'],
+                    "functions_reused": 0,
+                    "functions_rechecked": 0
+                }
+
+        if self.stats is not None:
+            self.stats.path = f
+
+        try:
+            if self.low_memory:
+                run_streaming(f, env, sink)
+            else:
+                code = streaming.parse(contents, f)
+                comments.attach(code.body, comments.grab_types(contents))
+                run_through(code.body, env, top_level=True, catch_errors=True, errors=sink)
+            for name in self.entries:
+                t = env.values.get(name)
+                if type(t) is PendingFunc:
+                    t.force()
+            complete = True
+        except TooManyErrors:
+            complete = False
+        except (SyntaxError, UnicodeDecodeError) as e:
+            # not Python: this file fails, not the whole run
+            complete = False
+            line = getattr(e, 'lineno', None) or 0
+            column = max((getattr(e, 'offset', None) or 1) - 1, 0)
+            try:
+                sink.put(Diagnostic(f, line, column, e.__class__.__name__,
+                                    "Couldn't parse this file: %s" %
+                                    getattr(e, 'msg', e)))
+            except TooManyErrors:
+                pass
+        except (RecursionError, MemoryError) as e:
+            # too deep or too big to parse or check: this file fails, not
+            # the whole run
+            complete = False
+            try:
+                sink.put(Diagnostic(f, 0, 0, e.__class__.__name__,
+                                    "Couldn't check this file: %s" %
+                                    (e or "out of memory")))
+            except TooManyErrors:
+                pass
+
+        exports = module_exports(env.values)
+
+        if cache is not None and complete:
+            # in the order they were found, so that a cache hit emits them
+            # the way the check did
+            cache.put(key, {
+                "errors": [d[1:] for d in sink.diagnostics],
+                "values": exports
+            })
+
+        result = {
+            "path": f,
+            "errors": sorted(sink, key=Diagnostic.sort_key),
+            "exports": exports,
+            "functions_reused": env.check.reused,
+            "functions_rechecked": env.check.rechecked
+        }
+        if self.stats is not None:
+            result['stats'] = self.stats.take()
+        if self.low_memory:
+            result['peak_rss_kib'] = stats.peak_rss_kib()
+        return result
+
+
+class FileCheck():
+    """
+    The state of one file's check, which every Env in it shares (Env.check):
+    the Checker, the modules from the checked tree that the file imports
+    (module name -> pypes.ModuleType) and the package its relative imports
+    start from, the specializations in progress, how many times a sibling
+    fixpoint has changed a function's type (specializations from before
+    then are out of date), and how many function bodies were reused from or
+    re-checked into the function cache.
+    """
+    __slots__ = ('checker', 'local_modules', 'package', 'specializing',
+                 'generation', 'reused', 'rechecked')
+
+    def __init__(self, checker):
+        self.checker = checker
+        self.local_modules = {}
+        self.package = None
+        self.specializing = []
+        self.generation = 0
+        self.reused = 0
+        self.rechecked = 0
+
+
+def _imports_of(component, graph, names, exports):
+    """The exports of the modules outside component that it imports."""
+    return {names[dep]: exports[dep] for path in component
+            for dep in graph[path] if dep not in component}
+
+
+def _schedule(pool, check_component, graph, names, cache, max_errors):
+    """
+    Checks the components of graph in pool with check_component, each as
+    soon as everything it imports has been checked, so independent parts of
+    the graph are checked in parallel. Yields the results in the same order
+    as one job would.
+    """
+    components = depgraph.strongly_connected(graph)
+    component_of = {}
+    for i, component in enumerate(components):
+        for path in component:
+            component_of[path] = i
+    waiting_on = [set() for _ in components]
+    dependents = [set() for _ in components]
+    for i, component in enumerate(components):
+        for path in component:
+            for dep in graph[path]:
+                j = component_of[dep]
+                if j != i:
+                    waiting_on[i].add(j)
+                    dependents[j].add(i)
+
+    done = queue.SimpleQueue()
+    exports = {}
+
+    def submit(i):
+        component = components[i]
+        members = [(path, names[path]) for path in component]
+        pool.apply_async(check_component,
+                         (members, _imports_of(component, graph, names, exports),
+                          cache, None, max_errors),
+                         callback=lambda results: done.put((i, results)),
+                         error_callback=lambda e: done.put((i, e)))
+
+    for i in range(len(components)):
+        if not waiting_on[i]:
+            submit(i)
+
+    workers = _worker_pids(pool)
+    finished = {}
+    next_i = 0
+    while next_i < len(components):
+        try:
+            i, results = done.get(timeout=POOL_POLL_SECONDS)
+        except queue.Empty:
+            # a component that a dead worker or result handler had is never
+            # coming back, so check on them rather than wait forever
+            _check_pool(pool, workers)
+            continue
+        if isinstance(results, BaseException):
+            raise results
+        if isinstance(results, bytes):
+            results = pickle.loads(results)
+        finished[i] = results
+        for path, result in zip(components[i], results):
+            exports[path] = result['exports']
+        for j in sorted(dependents[i]):
+            waiting_on[j].discard(i)
+            if not waiting_on[j]:
+                submit(j)
+        while next_i in finished:
+            yield from finished.pop(next_i)
+            next_i += 1
+
+
+# how often _schedule checks that the pool is still working
+POOL_POLL_SECONDS = 1.0
+
+
+def _worker_pids(pool):
+    """
+    The pids of pool's worker processes, or None if they may come and go (a
+    thread pool, or workers that only do one task each).
+    """
+    processes = getattr(pool, '_pool', ())
+    if pool._maxtasksperchild is not None or not all(hasattr(p, 'pid') for p in processes):
+        return None
+    return {p.pid for p in processes}
+
+
+def _check_pool(pool, workers):
+    """Raises RuntimeError if pool has lost a worker or its result handler."""
+    if not pool._result_handler.is_alive():
+        raise RuntimeError("The worker pool's result handler stopped")
+    if workers is not None and _worker_pids(pool) != workers:
+        raise RuntimeError("A worker process died")
+
+
+def limit_errors(results, emit=None, max_errors=None):
+    """
+    Passes on check_file results that were produced elsewhere, emitting their
+    diagnostics, until there have been max_errors of them.
+    """
+    for result in results:
+        if max_errors is not None:
+            result['errors'] = result['errors'][:max_errors]
+            max_errors -= len(result['errors'])
+        if emit is not None:
+            for d in result['errors']:
+                emit(d)
+        yield result
+        if max_errors is not None and max_errors <= 0:
+            return
+
+
+# a worker process' Checker, see _init_worker
+_WORKER_CHECKER = None
+
+
+def _init_worker(*options):
+    global _WORKER_CHECKER
+    stats.mark_rss()
+    _WORKER_CHECKER = Checker(*options)
+
+
+def _check_component(*args):
+    """
+    Checker.check_component, in a worker process. The results are sent back
+    pickled, so that one that can't be unpickled fails in _schedule rather
+    than in the pool's result handler, which would stop without a word.
+    """
+    return pickle.dumps(_WORKER_CHECKER.check_component(*args),
+                        pickle.HIGHEST_PROTOCOL)
+
+
+# whether trace_handlers has wrapped the handlers
+_traced = False
+_trace_lock = threading.Lock()
+
+
+def trace_handlers():
+    """
+    Makes every expression handler print what it's getting the type of, in
+    checks with a debug level above 2. The handlers are shared, so this is
+    done once per process.
+    """
+    global _traced
+    with _trace_lock:
+        if not _traced:
+            _traced = True
+            instrument(_trace_handler, tables=(EXPR_HANDLERS,))
+
+
+def _trace_handler(node_type, f):
+    def traced(expr, env):
+        if env.check.checker.debug_level > 2:
+            print("Getting type of %s" % expr)
+        return f(expr, env)
+    return traced
 
-    env = Env()
 
-    results = run_through(code.body, env, top_level=True, catch_errors=True)
+@functools.lru_cache(maxsize=1)
+def builtin_env():
+    """
+    The scope every module is on top of, shared by every check: the builtins
+    stub, read once and frozen, so that checks running at the same time can't
+    change it under each other (a module's own names go in its own scope).
+    """
+    return Env(types.MappingProxyType(dict(STUBS.load("builtins"))))
+
 
-    for e in sorted(results['errors'], key=lambda e: e.ast_obj.lineno):
-        print(str(e))
+# module name -> pypes.ModuleType for stub modules, so each is loaded once
+MODULES = {}
+
+
+def get_module_type(name, check):
+    """
+    The type of an imported module, or None if it isn't in the checked tree
+    (of the FileCheck check) and there's no stub for it.
+    """
+    module_t = check.local_modules.get(name)
+    if module_t is not None:
+        return module_t
+    module_t = MODULES.get(name)
+    if module_t is None:
+        if not STUBS.has_module(name):
+            return None
+        # setdefault so that checks in other threads get the same one
+        module_t = MODULES.setdefault(name, pypes.ModuleType(name, loader=STUBS.load))
+    return module_t
+
+
+def run_streaming(f, env, errors):
+    """
+    run_through for a whole module, a top-level statement at a time, without
+    holding on to any statement's tree once it's been checked. Like
+    run_through, it first goes over all the function signatures. errors is
+    an ErrorSink, which gets told where in the file each statement is.
+    """
+    for _, stmts in streaming.statements(f):
+        for expr in stmts:
+            if isinstance(expr, ast.FunctionDef):
+                try:
+                    env.add(expr.name, get_func_type(expr, env))
+                except (Heresy, LazyError):
+                    pass  # reported when the def itself is checked
+    for line_offset, stmts in streaming.statements(f):
+        errors.line_offset = line_offset
+        run_through(stmts, env, top_level=True, catch_errors=True, errors=errors)
 
 
-def run_through(exprs, env, top_level=False, catch_errors=False, expected_return_type=pypes.unknown):
+def module_exports(values):
+    """
+    The top-level names of a module that other modules can import. Modules
+    it imports are left out: otherwise every module would carry (and have to
+    pickle) everything it imports, and everything that imports.
+    """
+    exports = {}
+    for name, t in values.items():
+        if type(t) is PendingFunc:
+            # not worth checking the body for; the signature is what it says
+            t = t.declared if t.result is None else t.result
+        if not isinstance(t, pypes.ModuleType):
+            exports[name] = t
+    return exports
+
+
+def run_through(exprs, env, top_level=False, catch_errors=False,
+                expected_return_type=pypes.unknown, errors=None):
     """
     Runs through a list of expressions, e.g. a module top-level or a function body.
     Returns a dict of errors, values, and the return type (of a function).
+    With catch_errors, errors go into errors as they're found: a set by
+    default, or anything with an add method, like a diagnostics.ErrorSink.
     """
 
-    return_type = "noreturn"
-
-    if DEBUG_LEVEL > 2:
+    if env.check.checker.debug_level > 2:
         print("env is %s" % env)
 
-    errors = set()
+    if errors is None:
+        errors = set()
+
+    checker = env.check.checker
+
+    # the pre-pass looks at every body, which --lazy is trying not to do
+    if top_level and not checker.lazy:
+        resolver.resolve(exprs)
 
     # first get all top-level declared types without going into functions
     for expr in exprs:
         try:
             if isinstance(expr, ast.FunctionDef):
-                env.add(expr.name, get_func_type(expr, env))
+                if checker.low_memory:
+                    env.add(expr.name, get_func_type(expr, env))
+                else:
+                    env.define(expr.name, get_func_type(expr, env), expr)
         except Heresy as e:
             if catch_errors:
                 errors.add(e)
             else:
                 raise e
         except LazyError as e:
-            if DEBUG_LEVEL > 0:
+            if env.check.checker.debug_level > 0:
                 print("Unimplemented: " + str(e))
 
+    siblings = None
+    if not (checker.lazy or checker.low_memory):
+        siblings = Siblings.of(exprs)
+
+    run = {
+        "errors": errors,
+        "returns": "noreturn",
+        "top_level": top_level,
+        "catch_errors": catch_errors,
+        "expected_return_type": expected_return_type,
+        "siblings": siblings
+    }
 
     for expr in exprs:
         try:
-            if isinstance(expr, ast.FunctionDef):
-                env.add(expr.name, get_func_type_for_real(expr, env))
-            elif isinstance(expr, ast.ClassDef):
-                env.add(expr.name, get_class_type(expr, env))
-            elif isinstance(expr, ast.Assign):
-                if not isinstance(expr.targets[0], ast.Name):
-                    raise LazyError("Don't know how to deal with tuple assignment", expr)
-                if len(expr.targets) > 1:
-                    raise LazyError("Don't know how to deal with multiple targets.", expr)
-                if expr.targets[0].id in CONSTANTS:
-                    raise Heresy("Tried to redefine built-in '%s'" % expr.targets[0].id, expr)
-                env.add(expr.targets[0].id, get_type(expr.value, env))
-            elif isinstance(expr, ast.If):
-                branches = run_if(expr, env,
-                       top_level=top_level,
-                       catch_errors=catch_errors,
-                       expected_return_type=expected_return_type)
-                if branches['errors']:
-                    errors = errors.union(branches['errors'])
-                if branches['returns']:
-                    if return_type == 'noreturn':
-                        return_type = branches['returns']
-                    else:
-                        return_type = pypes.merge_types(return_type, branches['returns'])
-            elif isinstance(expr, ast.Return):
-                if top_level:
-                    raise Heresy("Can't 'return' outside of function", expr)
-                return_type = get_type(expr.value, env)
-                if DEBUG_LEVEL > 2:
-                    print("checking if %s fits expected return %s" %
-                          (return_type, expected_return_type))
-                if not pypes.type_fits(return_type, expected_return_type):
-                    raise Heresy("Trying to return '%s' but should return '%s'" %
-                                 (return_type, expected_return_type),
-                                 expr)
-
-            else:
+            # the functions so far must be settled before anything uses them
+            if siblings is not None and (siblings.pending or siblings.deferred) \
+                    and not isinstance(expr, ast.FunctionDef):
+                siblings.settle(env, errors, catch_errors)
+            handler = find_handler(STMT_HANDLERS, expr)
+            if handler is None:
                 get_type(expr, env)
+            else:
+                handler(expr, env, run)
         except Heresy as e:
             if catch_errors:
                 errors.add(e)
             else:
                 raise e
         except LazyError as e:
-            if DEBUG_LEVEL > 0:
+            if env.check.checker.debug_level > 0:
                 print("Unimplemented: " + str(e))
 
-    if top_level and DEBUG_LEVEL > 0:
+    if siblings is not None and (siblings.pending or siblings.deferred):
+        siblings.settle(env, errors, catch_errors)
+
+    if top_level and env.check.checker.debug_level > 0:
         for k, v in env.values.items():
             print("%s :: %s" % (k, v))
 
     return {
         "errors": errors,
-        "returns": return_type,
+        "returns": run['returns'],
         "values": env.values
     }
 
 
-def run_if(expr, env, top_level=False, catch_errors=False, expected_return_type=pypes.unknown):
+@stmt_handler(ast.FunctionDef)
+def run_func_def(expr, env, run):
+    checker = env.check.checker
+    if checker.lazy:
+        env.define(expr.name, PendingFunc(expr, env, get_func_type(expr, env),
+                                          run['errors'], run['catch_errors']),
+                   expr)
+    elif checker.low_memory:
+        # no specializing: remembering the def would keep its tree alive
+        env.add(expr.name, get_func_type_for_real(expr, env))
+    elif run['siblings'] is not None and expr in run['siblings'].requeued:
+        # may be checked again once the siblings it uses are known, so its
+        # errors wait until then
+        siblings = run['siblings']
+        if expr in siblings.stale:
+            siblings.pending.append(expr)
+        else:
+            siblings.ran.add(expr)
+        try:
+            env.define(expr.name, get_func_type_for_real(expr, env), expr)
+        except Heresy as e:
+            siblings.deferred[expr] = e
+    else:
+        if run['siblings'] is not None:
+            run['siblings'].ran.add(expr)
+        env.define(expr.name, get_func_type_for_real(expr, env), expr)
+
+
+class PendingFunc():
+    """
+    In lazy mode, stands in for a function in the Env it was defined in until
+    something looks it up (get_name_type), so that its body is only checked
+    if it is called, returned, or otherwise used. The body is checked once;
+    its errors go to the run that defined it, as they would have if it had
+    been checked right away.
+    """
+    __slots__ = ('expr', 'env', 'declared', 'errors', 'catch_errors', 'result')
+
+    def __init__(self, expr, env, declared, errors, catch_errors):
+        self.expr = expr
+        self.env = env
+        self.declared = declared
+        self.errors = errors
+        self.catch_errors = catch_errors
+        self.result = None
+
+    def force(self):
+        if self.result is None:
+            # what recursive calls see while the body is being checked
+            self.result = self.declared
+            try:
+                self.result = get_func_type_for_real(self.expr, self.env)
+            except Heresy as e:
+                if not self.catch_errors:
+                    raise
+                self.errors.add(e)
+            except LazyError as e:
+                if self.env.check.checker.debug_level > 0:
+                    print("Unimplemented: " + str(e))
+            if self.env.values.get(self.expr.name) is self:
+                self.env.values[self.expr.name] = self.result
+        return self.result
+
+    def __reduce__(self):
+        # a class's members are pickled with it; as in module_exports, the
+        # signature is all that goes
+        return (self.declared if self.result is None else self.result).__reduce__()
+
+
+class Siblings():
+    """
+    The functions defined directly in one body, which may use each other
+    before they've been inferred: a def only sees the declared signatures of
+    the functions after it (and of itself). Those "stale" functions are
+    inferred again before the next statement that isn't a def runs, or at
+    the end of the body, and then so is every function that uses one whose
+    signature changed, until nothing changes or the Checker's
+    max_fixpoint_rounds is reached. Errors in the functions that may be inferred again (the stale
+    ones and their users) are held back until then so that only the final
+    inference's count, once.
+    """
+    def __init__(self, users, stale):
+        self.users = users      # name -> sibling defs whose bodies mention it
+        self.stale = stale      # defs that use a sibling before its inference
+        # defs that settle may infer again
+        self.requeued = set(stale).union(*users.values())
+        self.pending = []       # stale defs that have run since the last settle
+        self.ran = set()        # defs that have run
+        self.deferred = {}      # def -> its latest Heresy
+
+    @classmethod
+    def of(cls, exprs):
+        """None if exprs has no function that uses a sibling defined after it."""
+        order = [expr for expr in exprs if isinstance(expr, ast.FunctionDef)]
+        if not order:
+            return None
+        position = {expr.name: idx for idx, expr in enumerate(order)}
+        refs = [sibling_refs(expr) for expr in order]
+        stale = set()
+        for idx, expr in enumerate(order):
+            for name in refs[idx]:
+                if position.get(name, -1) >= idx:
+                    stale.add(expr)
+                    break
+        if not stale:
+            return None
+        users = {}
+        for expr, names in zip(order, refs):
+            for name in names:
+                if name in position:
+                    users.setdefault(name, []).append(expr)
+        return cls(users, stale)
+
+    def settle(self, env, errors, catch_errors):
+        """Infers the pending functions (and their users) to a fixpoint."""
+        def bound(expr):
+            return env.find_definition(expr.name) == (expr, env)
+
+        # the stale functions and everything that has run that uses them,
+        # in order of definition
+        queue = [expr for expr in self.pending if bound(expr)]
+        self.ran.update(self.pending)
+        self.pending = []
+        for expr in queue:
+            for user in self.users.get(expr.name, ()):
+                if user in self.ran and user not in queue and bound(user):
+                    queue.append(user)
+        queue.sort(key=lambda e: e.lineno)
+
+        # start the functions whose return types are being inferred from
+        # "returns nothing", so that (mutually) recursive calls don't make
+        # them unknown
+        previous = {}
+        for expr in queue:
+            previous[expr] = t = env.values[expr.name]
+            if expr.returns is None and isinstance(t, pypes.FuncType):
+                env.define(expr.name, pypes.FuncType(t.args, "noreturn", t.kwargs), expr)
+                env.check.generation += 1
+
+        rounds = 0
+        while queue and rounds < env.check.checker.max_fixpoint_rounds:
+            rounds += 1
+            if env.check.checker.debug_level > 1:
+                print("Fixpoint round %d: %s" % (rounds, ", ".join(e.name for e in queue)))
+            changed = []
+            for expr in queue:
+                try:
+                    new = get_func_type_for_real(expr, env)
+                    self.deferred.pop(expr, None)
+                except Heresy as e:
+                    self.deferred[expr] = e
+                    new = get_func_type(expr, env)
+                except LazyError:
+                    new = get_func_type(expr, env)
+                env.define(expr.name, new, expr)
+                old = previous.get(expr, env.values[expr.name])
+                previous[expr] = new
+                if new != old:
+                    changed.append(expr)
+                    # what was specialized with the old type is stale
+                    env.check.generation += 1
+            queue = []
+            for expr in changed:
+                for user in self.users.get(expr.name, ()):
+                    # functions that haven't run yet will see the new type anyway
+                    if user in self.ran and user not in queue and bound(user):
+                        queue.append(user)
+                        previous.setdefault(user, env.values[user.name])
+
+        for expr in sorted(self.deferred, key=lambda e: e.lineno):
+            e = self.deferred.pop(expr)
+            if not catch_errors:
+                raise e
+            errors.add(e)
+
+
+@stmt_handler(ast.ClassDef)
+def run_class_def(expr, env, run):
+    env.add(expr.name, get_class_type(expr, env, run['errors'], run['catch_errors']))
+
+
+@stmt_handler(ast.Assign)
+def run_assign(expr, env, run):
+    if len(expr.targets) > 1:
+        raise LazyError("Don't know how to deal with multiple targets.", expr)
+    if isinstance(expr.targets[0], ast.Attribute):
+        run_attribute_assign(expr, env)
+        return
+    if not isinstance(expr.targets[0], ast.Name):
+        raise LazyError("Don't know how to deal with tuple assignment", expr)
+    if expr.targets[0].id in CONSTANTS:
+        raise Heresy("Tried to redefine built-in '%s'" % expr.targets[0].id, expr)
+    annotation = getattr(expr, 'comment_annotation', None)
+    if annotation is None:
+        env.add(expr.targets[0].id, get_type(expr.value, env))
+        return
+
+    # declared in a #:: comment, see comments.py
+    try:
+        declared_type = type_annotation2type(annotation, env)
+    except Heresy as e:
+        # the annotation was parsed on its own, so its line numbers are wrong
+        raise Heresy(e.message, expr)
+    except LazyError:
+        # an annotation it can't follow; the name is still bound
+        env.add(expr.targets[0].id, get_type(expr.value, env))
+        raise
+    value_type = get_type_expecting(expr.value, env, declared_type)
+    if not pypes.type_fits(value_type, declared_type):
+        raise Heresy("Assigning '%s' to '%s', declared as '%s'" %
+                     (value_type, expr.targets[0].id, declared_type), expr)
+    env.add(expr.targets[0].id, declared_type)
+
+
+def run_attribute_assign(expr, env):
     """
-    TODO: support elif
+    obj.name = value, where obj is an instance of a class the checker knows:
+    value has to fit the type the class gives the attribute.
     """
+    target = expr.targets[0]
+    obj_t = get_type(target.value, env)
+    if not isinstance(obj_t, pypes.InstanceType):
+        raise LazyError("Don't know how to assign attributes of %s" % obj_t, expr)
+    attr_t = get_class_attribute(obj_t.cls, target.attr, target, on_instance=True)
+    value_t = get_type_expecting(expr.value, env, attr_t)
+    if not pypes.type_fits(value_t, attr_t):
+        raise Heresy("Assigning '%s' to attribute '%s' of %s, which is '%s'" %
+                     (value_t, target.attr, obj_t, attr_t), expr)
+
+
+@stmt_handler(ast.If)
+def run_if_stmt(expr, env, run):
+    branches = run_if(expr, env,
+                      top_level=run['top_level'],
+                      catch_errors=run['catch_errors'],
+                      expected_return_type=run['expected_return_type'],
+                      errors=run['errors'])
+    run['returns'] = pypes.merge_types(run['returns'], branches['returns'])
+
+
+@stmt_handler(ast.Return)
+def run_return(expr, env, run):
+    if run['top_level']:
+        raise Heresy("Can't 'return' outside of function", expr)
+    expected_return_type = run['expected_return_type']
+    return_type = run['returns'] = get_type_expecting(expr.value, env, expected_return_type)
+    if env.check.checker.debug_level > 2:
+        print("checking if %s fits expected return %s" %
+              (return_type, expected_return_type))
+    if not pypes.type_fits(return_type, expected_return_type):
+        raise Heresy("Trying to return '%s' but should return '%s'" %
+                     (return_type, expected_return_type),
+                     expr)
 
-    if DEBUG_LEVEL > 2:
-        print("Exploring if statement expecting to return %s" % expected_return_type)
 
-    all_branches_return = True
-    errors = set()
-
-    possible_returns = set()
-    if_env = env.extend()
-    if_body = run_through(expr.body, if_env,
-                          top_level=top_level,
-                          catch_errors=catch_errors,
-                          expected_return_type=expected_return_type)
-    if if_body['returns'] != "noreturn":
-        possible_returns = pypes.merge_types(possible_returns, if_body['returns'])
-    else:
-        all_branches_return = False
-
-    if if_body['errors']:
-        errors = errors.union(if_body['errors'])
-
-    if expr.orelse:  # if there are else clauses
-        else_env = env.extend()
-        else_body = run_through(expr.orelse, else_env,
-                                top_level=top_level,
-                                catch_errors=catch_errors,
-                                expected_return_type=expected_return_type)
-        if else_body['returns'] != "noreturn":
-            possible_returns = pypes.merge_types(possible_returns, else_body['returns'])
+@stmt_handler(ast.Import)
+def run_import(expr, env, run):
+    for alias in expr.names:
+        if get_module_type(alias.name, env.check) is None:
+            raise LazyError("No stub for module %s" % alias.name, expr)
+        if alias.asname:
+            env.add(alias.asname, get_module_type(alias.name, env.check))
         else:
-            all_branches_return = True
+            # import os.path binds os; os.path is found as an attribute
+            top = alias.name.split(".")[0]
+            env.add(top, get_module_type(top, env.check) or pypes.unknown)
+
+
+@stmt_handler(ast.ImportFrom)
+def run_import_from(expr, env, run):
+    name = depgraph.absolute_module(expr.module, expr.level, env.check.package)
+    if name is None:
+        raise LazyError("Can't resolve relative import", expr)
+    module_t = get_module_type(name, env.check)
+    if module_t is None:
+        # a namespace package has no module of its own, only submodules
+        submodules = [get_module_type(name + "." + alias.name, env.check)
+                      for alias in expr.names]
+        if None in submodules:
+            raise LazyError("No stub for module %s" % name, expr)
+        for alias, t in zip(expr.names, submodules):
+            env.add(alias.asname or alias.name, t)
+        return
+    for alias in expr.names:
+        if alias.name == "*":
+            for name, t in module_t.attributes().items():
+                env.add(name, t)
+            continue
+        env.add(alias.asname or alias.name, get_module_attribute(module_t, alias.name, env))
+
+
+def run_if(expr, env, top_level=False, catch_errors=False,
+           expected_return_type=pypes.unknown, errors=None):
+    """
+    Runs both branches of an if statement, each in its own scope. An elif is
+    an if alone in the else branch; a ladder of them is walked in a loop,
+    with an else scope for each rung as if they were nested, so that long
+    generated ladders don't recurse once per elif.
+    """
 
-        if else_body['errors']:
-            errors = errors.union(else_body['errors'])
+    if env.check.checker.debug_level > 2:
+        print("Exploring if statement expecting to return %s" % expected_return_type)
 
-    if len(possible_returns) == 1:
-        possible_returns = possible_returns.pop()
+    if errors is None:
+        errors = set()
+
+    def run_branch(body, branch_env):
+        return run_through(body, branch_env,
+                           top_level=top_level,
+                           catch_errors=catch_errors,
+                           expected_return_type=expected_return_type,
+                           errors=errors)['returns']
+
+    # what each rung's if body returns, top down
+    rungs = [run_branch(expr.body, env.extend())]
+    while len(expr.orelse) == 1 and type(expr.orelse[0]) is ast.If:
+        env = env.extend()  # the else scope the elif is in
+        expr = expr.orelse[0]
+        rungs.append(run_branch(expr.body, env.extend()))
+
+    # fold the rungs back up, as each if would have returned to the one above
+    has_else = bool(expr.orelse)
+    returns = run_branch(expr.orelse, env.extend()) if has_else else "noreturn"
+    for if_returns in reversed(rungs):
+        all_branches_return = if_returns != "noreturn" or (has_else and returns == "noreturn")
+        returns = pypes.merge_types(if_returns, returns)
+        has_else = True
 
     return {
         "errors": errors,
-        "returns": possible_returns,
+        "returns": returns,
         "all_branches_return": all_branches_return
     }
 
 def get_type(expr, env):
-    if DEBUG_LEVEL > 2:
-        print("Getting type of %s" % expr)
-    if isinstance(expr, ast.FunctionDef):
-        return get_func_type(expr, env)
-    elif isinstance(expr, ast.Call):
-        return get_call_type(expr, env)
-    elif isinstance(expr, ast.Name):
-        return get_name_type(expr, env)
-    elif isinstance(expr, ast.Assign):
-        raise LazyError("run_through should handle ast.Assign, not get_type", expr)
-    elif isinstance(expr, ast.Expr):
-        get_expr_type(expr, env)
-    elif isinstance(expr, ast.Str):
-        return "str"
-    elif isinstance(expr, ast.Num):
-        if isinstance(expr.n, int):
-            return 'int'
-        elif isinstance(expr.n, float):
-            return 'float'
-        elif isinstance(expr.n, complex):
-            return 'complex'
-        else:
-            raise LazyError("Don't understand Num " + repr(expr.n), expr)
-    elif isinstance(expr, ast.BinOp):
-        if DEBUG_LEVEL > 2:
-            print("Type of binop at line %d is %s" % (expr.lineno, get_binop_type(expr, env)))
-        return get_binop_type(expr, env)
-    elif isinstance(expr, ast.List):
-        return get_list_type(expr, env)
-    elif isinstance(expr, ast.Dict):
-        return get_dict_type(expr, env)   
-    elif isinstance(expr, ast.If):
-        raise Heresy("if statement found outside module/function body")
-    elif isinstance(expr, ast.Pass):
-        return None
-    elif isinstance(expr, ast.ClassDef):
-        return get_class_type(expr, env)
-    else:
+    handler = find_handler(EXPR_HANDLERS, expr)
+    if handler is None:
         raise LazyError("Don't understand expr " + repr(expr), expr)
+    return handler(expr, env)
+
+
+# types of literal constants, by the class of their value
+CONSTANT_TYPES = {
+    str: "str",
+    bytes: "bytes",
+    int: "int",
+    float: "float",
+    complex: "complex",
+    bool: "bool",
+    type(None): "None"
+}
+
 
+@expr_handler(ast.Constant)
+def get_constant_type(expr, env):
+    try:
+        return CONSTANT_TYPES[type(expr.value)]
+    except KeyError:
+        raise LazyError("Don't understand constant " + repr(expr.value), expr)
+
+
+@expr_handler(ast.Assign)
+def get_assign_stmt_type(expr, env):
+    raise LazyError("run_through should handle ast.Assign, not get_type", expr)
+
+
+@expr_handler(ast.If)
+def get_if_type(expr, env):
+    raise Heresy("if statement found outside module/function body", expr)
+
+
+@expr_handler(ast.Pass)
+def get_pass_type(expr, env):
+    return None
 
-def type_annotation2type(expr):
+
+def type_annotation2type(expr, env=None):
+    """
+    The type an annotation stands for. With env, a name bound to a class
+    there stands for its instances; any other name is a type of that name.
+    """
     if isinstance(expr, ast.Name):
+        if expr.id == "Any":
+            return pypes.unknown
+        if env is not None:
+            t = env.find(expr.id)
+            if isinstance(t, pypes.ClassType):
+                return pypes.InstanceType(t)
         return expr.id
+    elif isinstance(expr, ast.Constant) and expr.value is None:
+        return None
     elif isinstance(expr, ast.List):
         # TODO: create separate errors for invalid type annotations
         if not expr.elts:
@@ -242,7 +1292,7 @@ def type_annotation2type(expr):
         elif len(expr.elts) > 1:
             raise Heresy("Cannot have multiple types in list.", expr)
         else:
-            return pypes.ListType(type_annotation2type(expr.elts[0]))
+            return pypes.ListType(type_annotation2type(expr.elts[0], env))
     elif isinstance(expr, ast.Dict):
         if not expr.keys:
             return Heresy("Cannot type empty dict. Try {Any: Any} instead.", expr)
@@ -250,51 +1300,269 @@ def type_annotation2type(expr):
             raise Heresy("Cannot have multiple key/value types in dict.", expr)
         else:
             return pypes.DictType(
-                type_annotation2type(expr.keys[0]),
-                type_annotation2type(expr.values[0]))
+                type_annotation2type(expr.keys[0], env),
+                type_annotation2type(expr.values[0], env))
     else:
         raise LazyError("Don't understand annotation %s" % expr, expr)
 
 
+STUBS = StubLibrary(type_annotation2type, __version__)
+
+
+@expr_handler(ast.Name)
 def get_name_type(expr, env):
     if expr.id in CONSTANTS:
         return CONSTANTS[expr.id]
-    if expr.id in env:
-        return env[expr.id]
-    else:
+    t = env.find(expr.id, getattr(expr, 'resolved_hops', None))
+    if t is MISSING:
         raise Heresy("Tried using var '%s' but it wasn't defined." % expr.id, expr)
+    if type(t) is PendingFunc:
+        return t.force()
+    return t
 
 
+@expr_handler(ast.FunctionDef)
 def get_func_type(expr, env):
     """Only looks at the declared type in the signature. Does not examine
     body."""
     params = [get_arg_type(arg, env) for arg in expr.args.args]
+    class_t = getattr(expr, 'in_class', None)
+    if class_t is not None and params and expr.args.args[0].annotation is None:
+        # self (or cls), as it will be bound
+        kind = method_kind(expr)
+        if kind == 'classmethod':
+            params[0] = class_t
+        elif kind != 'staticmethod':
+            params[0] = pypes.InstanceType(class_t)
     if expr.returns is not None:
-        rv = type_annotation2type(expr.returns)
+        rv = type_annotation2type(expr.returns, env)
     else:
         rv = pypes.unknown
     return pypes.FuncType(params, rv)
 
 
 def get_func_type_for_real(expr, env):
-    """Uses both the declared type and the inferred type."""
+    """Uses both the declared type and the inferred type. If the checker has a
+    function cache, the body is only walked when it or a name it uses has
+    changed."""
+    function_cache = env.check.checker.function_cache
+    if function_cache is None:
+        return infer_func_type(expr, env)
+
+    key = function_cache.key(function_key(expr, env))
+    summary = function_cache.get(key)
+    if summary is not None:
+        env.check.reused += 1
+        if summary[0] == "type":
+            return summary[1]
+        # replay the error on the same node of this (identical) function
+        _, cls_name, node_idx, message = summary
+        for idx, node in enumerate(ast.walk(expr)):
+            if idx == node_idx:
+                break
+        raise getattr(pypes, cls_name)(message, node)
+
+    env.check.rechecked += 1
+    try:
+        func_t = infer_func_type(expr, env)
+    except Heresy as e:
+        for idx, node in enumerate(ast.walk(expr)):
+            if node is e.ast_obj:
+                function_cache.put(key, ("error", e.__class__.__name__, idx, e.message))
+                break
+        raise
+    function_cache.put(key, ("type", func_t))
+    return func_t
+
+
+def function_key(expr, env):
+    """
+    Hashes the structure of a FunctionDef (ignoring where it is in the file)
+    together with the current types of every name it refers to.
+    """
+    h = hashlib.sha256(dump_structure(expr).encode())
+    class_t = getattr(expr, 'in_class', None)
+    if class_t is not None:
+        # what self is
+        h.update(type_key(class_t).encode())
+    for name in names_used(expr):
+        t = env.find(name)
+        if type(t) is PendingFunc:
+            t = t.force()
+        if t is not MISSING:
+            h.update(("%s:%s;" % (name, type_key(t))).encode())
+    return h.digest()
+
+
+def sibling_refs(expr):
+    """
+    The names a FunctionDef refers to from the body it is defined in, as
+    the resolver found them; every name in it, if it wasn't resolved.
+    """
+    refs = getattr(expr, 'sibling_refs', None)
+    if refs is None:
+        return names_used(expr)
+    return refs
+
+
+def names_used(expr):
+    """
+    The names a FunctionDef refers to, sorted. Worked out once per def and
+    kept on it.
+    """
+    names = getattr(expr, 'used_names', None)
+    if names is None:
+        names = expr.used_names = tuple(sorted(set(
+            node.id for node in ast.walk(expr) if isinstance(node, ast.Name))))
+    return names
+
+
+# markers for dump_structure's todo list, which also holds field values
+_END_NODE = object()
+_END_LIST = object()
+_ANNOTATION = object()
+
+
+def dump_structure(node):
+    """
+    Like ast.dump(node, include_attributes=False), as far as telling trees
+    apart goes, but walked with a todo list instead of recursively, so that
+    the deep trees of generated code don't hit the recursion limit. The #::
+    comment a statement has (see comments.py) counts as part of it.
+    """
+    parts = []
+    todo = [node]
+    while todo:
+        item = todo.pop()
+        if item is _END_NODE:
+            parts.append(")")
+        elif item is _END_LIST:
+            parts.append("]")
+        elif item is _ANNOTATION:
+            parts.append("#::")
+        elif isinstance(item, ast.AST):
+            parts.append(type(item).__name__ + "(")
+            todo.append(_END_NODE)
+            annotation = getattr(item, 'comment_annotation', None)
+            if annotation is not None:
+                todo.append(annotation)
+                todo.append(_ANNOTATION)
+            for field in reversed(item._fields):
+                todo.append(getattr(item, field, None))
+        elif isinstance(item, list):
+            parts.append("[")
+            todo.append(_END_LIST)
+            todo.extend(reversed(item))
+        else:
+            parts.append(repr(item) + ",")
+    return "".join(parts)
+
+
+def type_key(t):
+    """
+    A repr of t that doesn't depend on set ordering. Classes go by what's in
+    them, not just their names.
+    """
+    if type(t) is PendingFunc:
+        t = t.declared if t.result is None else t.result
+    if isinstance(t, pypes.ClassType):
+        return "%r{%s}" % (t, ", ".join("%s:%s:%s" % (name, kind, type_key(member))
+                                        for name, (member, kind) in sorted(t.items())))
+    if isinstance(t, pypes.InstanceType):
+        return "instance of %s" % type_key(t.cls)
+    if isinstance(t, (pypes.SomeType, frozenset)):
+        return "{%s}" % ", ".join(sorted(map(type_key, t)))
+    if isinstance(t, pypes.ModuleType) and t.version is not None:
+        return "%r@%s" % (t, t.version)
+    return repr(t)
+
+
+def exports_digest(values):
+    """A hash of a module's exported names and their types."""
+    h = hashlib.sha256()
+    for name in sorted(values):
+        h.update(("%s:%s;" % (name, type_key(values[name]))).encode())
+    return h.hexdigest()
+
+
+def infer_func_type(expr, env, arg_types=None):
+    """
+    Checks the body of a function. arg_types, if given, are the types to
+    assume for the arguments instead of the declared ones.
+    """
     declared_type = get_func_type(expr, env)
     # create a new scope!!
-    if DEBUG_LEVEL > 1:
+    if env.check.checker.debug_level > 1:
         print("Diving into %s" % expr.name)
 
+    if getattr(expr, 'in_class', None) is not None:
+        # a method can't see the names in its class body
+        env = env.parent
     body_env = env.extend()
 
-    for arg in expr.args.args:
-        body_env.add(arg.arg, get_arg_type(arg, env))
+    if arg_types is None:
+        arg_types = declared_type.args
+    for arg, arg_t in zip(expr.args.args, arg_types):
+        body_env.add(arg.arg, arg_t)
 
-    apparent_return_type = get_func_body_type(expr.body, env.extend(), declared_type.ret)
+    apparent_return_type = get_func_body_type(expr.body, body_env, declared_type.ret)
+    if apparent_return_type == "noreturn" and declared_type.ret is None:
+        # falling off the end returns None
+        apparent_return_type = None
     if not pypes.type_fits(apparent_return_type, declared_type.ret):
         raise Heresy("Return type of '%s' declared as '%s' but seems to be '%s'" %
                      (expr.name, declared_type.ret, apparent_return_type),
                      expr)
-    declared_type.ret = apparent_return_type
-    return declared_type
+    return pypes.FuncType(declared_type.args, apparent_return_type,
+                          declared_type.kwargs)
+
+
+def specialize(name, env, func_t, arg_ts):
+    """
+    The return type of calling the function bound to name with arguments of
+    types arg_ts: its body is checked again with the unannotated parameters
+    bound to those types. Results are kept in the checker's specializations,
+    which all its files share, keyed by the types of the names the body
+    uses as well, until a sibling fixpoint changes a function's type
+    (FileCheck.generation). A call that
+    is already being specialized (recursion), or one more than
+    MAX_SPECIALIZATION_DEPTH deep, gets the generic return type; so does
+    one whose body doesn't check with these types, since the generic check
+    of the body has already reported what's wrong with it.
+    """
+    found = env.find_definition(name)
+    if found is None:
+        return func_t.ret
+    expr, def_env = found
+    if len(arg_ts) != len(func_t.args):
+        return func_t.ret
+    arg_ts = tuple(arg_t if declared == pypes.unknown else declared
+                   for declared, arg_t in zip(func_t.args, arg_ts))
+    if arg_ts == func_t.args:
+        return func_t.ret
+
+    # the body's result also depends on what the names it uses are now
+    free_ts = tuple(def_env.find(name) for name in names_used(expr))
+    key = (expr, def_env, arg_ts, free_ts, env.check.generation)
+    try:
+        return env.check.checker.specializations[key]
+    except KeyError:
+        pass
+    specializing = env.check.specializing
+    if key in specializing or len(specializing) >= MAX_SPECIALIZATION_DEPTH:
+        return func_t.ret
+
+    if env.check.checker.debug_level > 1:
+        print("Specializing %s for (%s)" % (name, ", ".join(map(str, arg_ts))))
+    specializing.append(key)
+    try:
+        ret = infer_func_type(expr, def_env, arg_ts).ret
+    except (Heresy, LazyError):
+        ret = func_t.ret
+    finally:
+        specializing.pop()
+    env.check.checker.specializations[key] = ret
+    return ret
 
 
 def get_func_body_type(exprs, env, expected_return_type):
@@ -305,11 +1573,12 @@ def get_func_body_type(exprs, env, expected_return_type):
 
 def get_arg_type(ast_arg, env):
     if ast_arg.annotation:
-        return type_annotation2type(ast_arg.annotation)
+        return type_annotation2type(ast_arg.annotation, env)
     else:
         return pypes.unknown
 
 
+@expr_handler(ast.Expr)
 def get_expr_type(expr, env):
     """
     This takes an ast.Expr, not to be confused with any old 'expr'.
@@ -328,63 +1597,169 @@ def is_callable(t):
         return False
 
 
+@expr_handler(ast.Attribute)
+def get_attribute_type(expr, env):
+    value_t = get_type(expr.value, env)
+    if isinstance(value_t, pypes.ModuleType):
+        return get_module_attribute(value_t, expr.attr, env)
+    if isinstance(value_t, pypes.InstanceType):
+        return get_class_attribute(value_t.cls, expr.attr, expr, on_instance=True)
+    if isinstance(value_t, pypes.ClassType):
+        return get_class_attribute(value_t, expr.attr, expr, on_instance=False)
+    raise LazyError("Don't know how to do attribute access.", expr)
+
+
+def get_class_attribute(class_t, name, expr, on_instance):
+    """
+    The type of attribute name of class_t, or of an instance of it, from
+    the class's attribute table. A method looked up on an instance is bound
+    to it, so it takes one argument fewer.
+    """
+    found = class_t.lookup(name)
+    if found is None:
+        if class_t.open or class_t.lookup('__getattr__') is not None:
+            return pypes.unknown
+        if on_instance:
+            raise Heresy("'%s' object has no attribute '%s'" % (class_t.name, name), expr)
+        raise Heresy("Class %s has no attribute '%s'" % (class_t.name, name), expr)
+    t, kind = found
+    if type(t) is PendingFunc:
+        t = t.force()
+    if kind == 'property':
+        if on_instance and isinstance(t, pypes.FuncType):
+            return t.ret
+        return pypes.unknown
+    if kind == 'descriptor':
+        return pypes.unknown
+    if kind == 'classmethod' or (kind == 'method' and on_instance):
+        return bind_method(t)
+    return t
+
+
+def bind_method(func_t):
+    """func_t with its first argument (self or cls) already given."""
+    if isinstance(func_t, pypes.Overload):
+        return pypes.Overload(bind_method(t) for t in func_t)
+    if isinstance(func_t, pypes.FuncType) and func_t.args:
+        return pypes.FuncType(func_t.args[1:], func_t.ret, func_t.kwargs, func_t.varargs)
+    return func_t
+
+
+def get_module_attribute(module_t, name, env):
+    attributes = module_t.attributes()
+    if name in attributes:
+        return attributes[name]
+    submodule_t = get_module_type(module_t.name + "." + name, env.check)
+    if submodule_t is not None:
+        return submodule_t
+    # stubs don't list everything in a module
+    return pypes.unknown
+
+
+def call_name(call):
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    return ast.unparse(call.func)
+
+
+@expr_handler(ast.Call)
 def get_call_type(call, env):
-    if isinstance(call.func, ast.Attribute):
-        raise LazyError("Don't know how to do method calls.", call)
-    # TODO: check if func is expr, maybe use get_type instead?
     func_t = get_type(call.func, env)
-    if DEBUG_LEVEL > 2:
+    if env.check.checker.debug_level > 2:
         print("call to %s" % func_t)
     if isinstance(func_t, pypes.FuncType):
-        if len(call.args) != len(func_t.args):
+        params = func_t.params_for(len(call.args))
+        if params is None:
             raise Heresy("Function %s expects %d arguments, %d provided" %
-                            (call.func.id, len(func_t.args), len(call.args)),
+                            (call_name(call), len(func_t.args), len(call.args)),
                             call)
-        for idx, args in enumerate(zip(call.args, func_t.args)):
+        arg_ts = []
+        for idx, args in enumerate(zip(call.args, params)):
             arg, arg_t = args
-            call_arg_t = get_type(arg, env)
+            call_arg_t = get_type_expecting(arg, env, arg_t)
             if not pypes.type_fits(call_arg_t, arg_t):
                 raise Heresy("Argument %d of call to %s should be %s, not %s" %
-                             (idx, call.func.id, arg_t, call_arg_t),
+                             (idx, call_name(call), arg_t, call_arg_t),
                              call)
+            arg_ts.append(call_arg_t)
+        if pypes.unknown in params and isinstance(call.func, ast.Name):
+            return specialize(call.func.id, env, func_t, arg_ts)
         return func_t.ret
+    elif isinstance(func_t, pypes.Overload):
+        arg_ts = [get_type(arg, env) for arg in call.args]
+        try:
+            return func_t.for_args(arg_ts)
+        except ValueError:
+            raise Heresy("No signature of %s takes (%s)" %
+                         (call_name(call), ", ".join(map(str, arg_ts))),
+                         call)
+    elif func_t == pypes.unknown:
+        for arg in call.args:
+            get_type(arg, env)
+        return pypes.unknown
     elif isinstance(func_t, pypes.ClassType):
         """For a class Foo, calling Foo(*args) should result in an object of
         type Foo."""
-        # TODO: support no initializer (no args)
-        init = func_t.env['__init__']
-        if len(call.args) + 1 != len(init.args):
-            raise Heresy("Class initializer %s() expects %d arguments, %d provided" %
-                            (call.func.id, len(init.args), len(call.args)),
-                            call)
-        for idx, args in enumerate(zip(call.args, init.args[1:])):
+        if func_t.lookup('__init__') is not None:
+            init = get_class_attribute(func_t, '__init__', call, on_instance=True)
+        elif func_t.open:
+            init = pypes.unknown
+        else:
+            init = pypes.FuncType([], None)  # object.__init__
+        if isinstance(init, pypes.FuncType):
+            params = init.params_for(len(call.args))
+            if params is None:
+                raise Heresy("Class initializer %s() expects %d arguments, %d provided" %
+                             (call_name(call), len(init.args), len(call.args)),
+                             call)
+        else:
+            params = [pypes.unknown] * len(call.args)
+        for idx, args in enumerate(zip(call.args, params)):
             arg, arg_t = args
-            call_arg_t = get_type(arg, env)
+            call_arg_t = get_type_expecting(arg, env, arg_t)
             if not pypes.type_fits(call_arg_t, arg_t):
                 raise Heresy("Argument %d of call to %s should be %s, not %s" %
-                             (idx, call.func.id, arg_t, call_arg_t),
+                             (idx, call_name(call), arg_t, call_arg_t),
                              call)
-        return func_t
+        return pypes.InstanceType(func_t)
     else:
         raise Heresy("'%s' is not callable." % func_t, call)
 
 
+@expr_handler(ast.BinOp)
 def get_binop_type(expr, env):
     """
     expr should be an ast.BinOp, and this needs to convert the binop to the
     corresponding method on the left type.
     Only builtin types supported right now :(
     TODO: add support for custom types
+    Generated code has a + b + ... chains thousands of terms long, which
+    nest down the left; those are walked in a loop rather than recursively.
     """
-    left_t = get_type(expr.left, env)
-    right_t = get_type(expr.right, env)
+    chain = [expr]
+    while type(chain[-1].left) is ast.BinOp:
+        chain.append(chain[-1].left)
+    left_t = get_type(chain[-1].left, env)
+    for expr in reversed(chain):
+        left_t = binop_type(expr, left_t, get_type(expr.right, env), env)
+    return left_t
+
 
+def binop_type(expr, left_t, right_t, env):
+    """The type of binop expr in env, given the types of its operands."""
     # lookup which method goes with this binop
     # can't directly do BINOPS[expr.op], unfortunately
-    binop_method = BINOPS[expr.op.__class__.__name__]
+    binop_method = BINOPS.get(expr.op.__class__.__name__)
+    if binop_method is None:
+        raise LazyError("Don't know the operator %s" % expr.op.__class__.__name__, expr)
 
-    if left_t not in builtins.classes:
-        if DEBUG_LEVEL > 0:
+    # arithmetic on numbers is by far the most common case
+    binop_result_t = builtins.numeric_binops.get((binop_method, left_t, right_t))
+    if binop_result_t is not None:
+        return binop_result_t
+
+    if left_t not in builtins.classes or binop_method not in builtins.classes[left_t]:
+        if env.check.checker.debug_level > 0:
             print("Type %s is not recognized. Can't typecheck this binop." % left_t)
         return pypes.unknown
 
@@ -392,49 +1767,211 @@ def get_binop_type(expr, env):
     # should be a FuncType
 
     try:
-        return binop_t.for_args([left_t, right_t])
+        binop_result_t = binop_t.for_args([left_t, right_t])
     except ValueError:
         raise Heresy("Tried doing (%s %s %s) which doesn't match type %s" %
                      (left_t, expr.op.__class__.__name__, right_t, binop_t),
                      expr)
+    if env.check.checker.debug_level > 2:
+        print("Type of binop at line %d is %s" % (expr.lineno, binop_result_t))
+    return binop_result_t
 
 
-def get_list_type(expr, env):
+@expr_handler(ast.List)
+def get_list_type(expr, env, expected=None):
     """
-    Right now, we only look at the first element in the list and assume that
-    all the other elements in the list are the same.
+    Unifies the types of all the elements. If expected is a list type, every
+    element has to fit its element type.
     """
     if not expr.elts:  # it's just an empty list
         return pypes.ListType()
-    else:
-        return pypes.ListType(get_type(expr.elts[0], env))
+    inner = None
+    if isinstance(expected, pypes.ListType) and expected.inner != "emptylist":
+        inner = expected.inner
+    return pypes.ListType(unify_elements(expr.elts, env, inner))
 
 
-def get_dict_type(expr, env):
+@expr_handler(ast.Dict)
+def get_dict_type(expr, env, expected=None):
     """
-    Right now, we only look at the first element in the list and assume that
-    all the other elements in the list are the same.
+    Unifies the types of all the keys and of all the values. If expected is a
+    dict type, every key and value has to fit it.
     """
-    if not expr.values:  # it's just an empty list
+    if not expr.values:  # it's just an empty dict
         return pypes.DictType()
-    else:
-        return pypes.DictType(
-            get_type(expr.keys[0], env),
-            get_type(expr.values[0], env))
+    if None in expr.keys:
+        raise LazyError("Don't know how to do ** in dict literals.", expr)
+    k = v = None
+    if isinstance(expected, pypes.DictType) and expected.k != "emptydict":
+        k, v = expected.k, expected.v
+    return pypes.DictType(
+        unify_elements(expr.keys, env, k),
+        unify_elements(expr.values, env, v))
 
 
-def get_class_type(expr, env):
-    if len(expr.bases) > 1:
-        raise LazyError("Multiple class bases not yet supported.")
+def unify_elements(elts, env, expected=None):
+    """
+    The union of the types of elts, merged in one pass: constants of a kind
+    already seen are skipped, and the union is bounded like any other (see
+    pypes.SomeType), though once it is unknown the remaining elements are
+    only checked. With an expected type, the first element that doesn't fit
+    it is reported on its own line.
+    """
+    result = "noreturn"
+    seen_constants = set()
+    for elt in elts:
+        if type(elt) is ast.Constant:
+            kind = type(elt.value)
+            if kind in seen_constants:
+                continue
+            seen_constants.add(kind)
+        try:
+            t = get_type(elt, env)
+        except LazyError:
+            t = pypes.unknown
+        if expected is not None and not pypes.type_fits(t, expected):
+            raise Heresy("Element should be '%s' but is '%s'" % (expected, t), elt)
+        if result != pypes.unknown:
+            result = pypes.merge_types(result, t)
+    return result
 
-    results = run_through(expr.body, env)
-    if expr.bases:
-        return pypes.ClassType(expr.bases[0], results['values'])
-    else:
-        return pypes.ClassType(None, results['values'])
+
+def get_type_expecting(expr, env, expected):
+    """
+    get_type, except that list and dict literals are checked element by
+    element against expected so a bad element is reported where it is.
+    """
+    if type(expr) is ast.List:
+        return get_list_type(expr, env, expected)
+    if type(expr) is ast.Dict:
+        return get_dict_type(expr, env, expected)
+    return get_type(expr, env)
+
+
+@expr_handler(ast.ClassDef)
+def get_class_type(expr, env, errors=None, catch_errors=False):
+    """
+    The ClassType of a class statement. Its body is checked in a scope of its
+    own, which becomes the class's members: everything but the functions
+    first, then the functions, so that methods can use class attributes
+    bound after them. The functions and classes in
+    it get an in_class attribute, so that they know what self is and that
+    they can't see that scope.
+    """
+    bases = []
+    is_open = bool(expr.keywords)  # a metaclass could do anything
+    for base in expr.bases:
+        if isinstance(base, ast.Name) and base.id in PYTHON_BUILTINS \
+                and env.find(base.id) is env.check.checker.builtins.find(base.id):
+            # object, Exception, ... (unless the module rebinds them): the
+            # stubs don't describe them as classes
+            is_open = is_open or base.id != "object"
+            continue
+        base_t = get_type(base, env)
+        if isinstance(base_t, pypes.ClassType):
+            bases.append(base_t)
+        else:
+            is_open = True
+
+    if not bases:
+        bases.append(pypes.OBJECT)  # for the attributes every object has
+
+    scope_env = env.parent if getattr(expr, 'in_class', None) is not None else env
+    class_env = scope_env.extend()
+    kinds = {stmt.name: method_kind(stmt) for stmt in expr.body
+             if isinstance(stmt, ast.FunctionDef)}
+    try:
+        class_t = pypes.ClassType(expr.name, bases, class_env.values, kinds,
+                                  instance_attributes(expr, env), is_open)
+    except ValueError as e:
+        raise Heresy(str(e), expr)
+    for stmt in expr.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            stmt.in_class = class_t
+
+    # a method may use anything the class body binds, wherever it's bound,
+    # so the rest of the body runs first, with the methods' declared
+    # signatures, and then the methods are inferred
+    defs = [stmt for stmt in expr.body if isinstance(stmt, ast.FunctionDef)]
+    for stmt in defs:
+        try:
+            class_env.define(stmt.name, get_func_type(stmt, class_env), stmt)
+        except (Heresy, LazyError):
+            pass  # reported when the defs run
+    run_through([stmt for stmt in expr.body if not isinstance(stmt, ast.FunctionDef)],
+                class_env, catch_errors=catch_errors, errors=errors)
+    # by the time a method runs, the class statement has bound the name
+    env.add(expr.name, class_t)
+    run_through(defs, class_env, catch_errors=catch_errors, errors=errors)
+    class_t.finish()
+    return class_t
+
+
+def method_kind(expr):
+    """How the function expr binds when it's in a class body."""
+    kind = 'method'
+    for decorator in expr.decorator_list:
+        if isinstance(decorator, ast.Name) and decorator.id in (
+                'staticmethod', 'classmethod', 'property'):
+            kind = decorator.id
+        elif isinstance(decorator, ast.Attribute) and decorator.attr in (
+                'setter', 'getter', 'deleter'):
+            # @name.setter and the like; the property's type is lost
+            kind = 'descriptor'
+    return kind
+
+
+def instance_attributes(expr, env):
+    """
+    The attributes that the methods of class expr assign (or augment) on
+    self, with the types their annotations or #:: comments declare for them,
+    or unknown.
+    """
+    found = {}
+    for stmt in expr.body:
+        if not isinstance(stmt, ast.FunctionDef) or not stmt.args.args \
+                or method_kind(stmt) != 'method':
+            continue
+        self_name = stmt.args.args[0].arg
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Assign):
+                targets = node.targets
+                annotation = getattr(node, 'comment_annotation', None)
+            elif isinstance(node, ast.AnnAssign):
+                targets = [node.target]
+                annotation = node.annotation
+            elif isinstance(node, ast.AugAssign):
+                targets = [node.target]
+                annotation = None
+            else:
+                continue
+            if len(targets) != 1 or not isinstance(targets[0], ast.Attribute):
+                annotation = None  # a declared type is for the whole target
+            for attr in self_attributes(targets, self_name):
+                if annotation is None or found.get(attr, pypes.unknown) != pypes.unknown:
+                    found.setdefault(attr, pypes.unknown)
+                    continue
+                try:
+                    found[attr] = type_annotation2type(annotation, env)
+                except Heresy as e:
+                    # the annotation was parsed on its own, see run_assign
+                    raise Heresy(e.message, node)
+                except LazyError:
+                    found[attr] = pypes.unknown
+    return found
+
+
+def self_attributes(targets, self_name):
+    """The attributes of self_name that assigning to targets sets."""
+    for target in targets:
+        if isinstance(target, (ast.Tuple, ast.List)):
+            yield from self_attributes(target.elts, self_name)
+        elif isinstance(target, ast.Starred):
+            yield from self_attributes([target.value], self_name)
+        elif isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) \
+                and target.value.id == self_name:
+            yield target.attr
 
 
 if __name__ == "__main__":
-    if 'DEBUG' in os.environ:
-        DEBUG_LEVEL = int(os.environ['DEBUG'])
-    main(sys.argv[1])
+    main(sys.argv[1:])
@@ -1,4 +1,96 @@
+from collections import OrderedDict, deque
+import contextvars
+import threading
+import weakref
+
+
+# reentrant, since collecting a type (and so dropping it from its table)
+# can happen in the middle of interning another
+_intern_lock = threading.RLock()
+
+
+class WeakTable(dict):
+    """
+    Maps keys to values it only holds weakly: an entry goes away with its
+    value. find and keep are the lookups; a plain dict holding weak
+    references is quicker than weakref.WeakValueDictionary. The last few
+    values kept are also held strongly, so that a type that is made, dropped
+    and made again right away isn't built from scratch each time.
+    """
+    def __init__(self, recent=4096):
+        dict.__init__(self)
+        self.recent = deque(maxlen=recent)
+
+    def find(self, key):
+        ref = self.get(key)
+        return None if ref is None else ref()
+
+    def keep(self, key, value):
+        self[key] = weakref.KeyedRef(value, self._forget, key)
+        self.recent.append(value)
+
+    def _forget(self, ref):
+        with _intern_lock:
+            if self.get(ref.key) is ref:
+                del self[ref.key]
+
+
+def _weak_key(value):
+    """
+    The tuple value, with the types in it (and in tuples in it) replaced by
+    weak references to them. Those compare equal while the types are alive,
+    and an interned type keeps the types it is made of alive.
+    """
+    for v in value:
+        if isinstance(v, (Type, tuple)):
+            break
+    else:
+        return value
+    return tuple([_ref(v) if isinstance(v, Type) else
+                  _weak_key(v) if type(v) is tuple else v
+                  for v in value])
+
+
+_ref = weakref.ref
+
+
 class Type():
+    """
+    Types are immutable and hash-consed: building a type that already exists
+    gives back the existing object. That makes == a pointer check and lets any
+    type be used as a dict key. The table only holds types weakly, keyed by
+    weak references to the types they are made of, so one that nothing uses
+    any more (say, from a file a daemon checked a while ago) goes away,
+    rather than every type ever made staying alive: a key holding its parts
+    strongly would keep a class alive, and the class its methods' types.
+    """
+    __slots__ = ('__weakref__',)
+
+    # (class, *fields) -> the canonical instance
+    _interned = WeakTable()
+
+    @classmethod
+    def _intern(cls, *fields):
+        key = (cls,) + _weak_key(fields)
+        t = Type._interned.find(key)
+        if t is None:
+            with _intern_lock:
+                # under the lock so that racing threads agree on one instance
+                t = Type._interned.find(key)
+                if t is None:
+                    t = object.__new__(cls)
+                    for name, value in zip(cls.__slots__, fields):
+                        object.__setattr__(t, name, value)
+                    Type._interned.keep(key, t)
+        return t
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % self.__class__.__name__)
+
+    def __reduce__(self):
+        # unpickle through the constructor so the result is interned too
+        return (self.__class__, tuple(getattr(self, f) for f in self.__slots__))
+
     def accepts(self, T):
         """
         Returns true if this the type T is equal to this type or is a subset of
@@ -14,20 +106,29 @@ class Type():
 
 
 class FuncType(Type):
-    args = []
-    kwargs = []
-    ret = None
-    def __init__(self, args, rv, kwargs=None):
-        self.args = args
-        self.ret = rv
-        if kwargs is not None:
-            self.kwargs = kwargs
+    # varargs is the type of each extra positional argument (*args), if any
+    __slots__ = ('args', 'ret', 'kwargs', 'varargs')
+
+    def __new__(cls, args, rv, kwargs=(), varargs=None):
+        return cls._intern(tuple(args), rv, tuple(kwargs), varargs)
+
+    def params_for(self, n):
+        """
+        The types of the parameters that n positional arguments would go to,
+        or None if this function can't take n of them.
+        """
+        if n == len(self.args):
+            return self.args
+        if self.varargs is not None and n > len(self.args):
+            return self.args + (self.varargs,) * (n - len(self.args))
+        return None
 
     def accepts_args(self, given_args):
-        if len(self.args) != len(given_args):
+        params = self.params_for(len(given_args))
+        if params is None:
             return False
 
-        for my_arg, call_arg in zip(self.args, given_args):
+        for my_arg, call_arg in zip(params, given_args):
             if not type_fits(call_arg, my_arg):
                 return False
         return True
@@ -35,7 +136,7 @@ class FuncType(Type):
     def accepts(self, T):
         if not isinstance(T, FuncType):
             return False
-        if len(T.args) != len(self.args):
+        if len(T.args) != len(self.args) or T.varargs != self.varargs:
             return False
         if not type_fits(T.ret, self.ret):
             return False
@@ -48,35 +149,209 @@ class FuncType(Type):
 
     def __str__(self):
         kwargs = ["%s=%s" % (k, v) for k, v in self.kwargs]
-        args = ", ".join(list(map(str, self.args)) + self.kwargs)
+        varargs = [] if self.varargs is None else ["*%s" % self.varargs]
+        args = ", ".join(list(map(str, self.args)) + varargs + kwargs)
         return "(%s) -> %s" % (args, str(self.ret))
 
 
 class ClassType(Type):
-    """Classes have their own internal environment, which are its 'fields' and
-    'methods'. Really, it's the top-level declarations within the class body."""
+    """
+    A class. Classes are nominal: each class statement makes a new type,
+    compared by identity. bases are the ClassTypes it inherits from, members
+    the names bound in its body (the dict its body is checked in), and
+    instance_attributes the attributes its methods assign on self. kinds
+    says how each function in the body binds: 'method', 'staticmethod',
+    'classmethod', 'property' or 'descriptor' (anything else it can't
+    follow). An open class has an ancestor the checker doesn't know, so it
+    may have attributes no one can see.
+
+    The C3 method resolution order is worked out once, when the class is
+    made. Once the body has been checked, finish() flattens the members of
+    everything in the MRO into one table, so looking up an attribute is a
+    single dict lookup rather than a walk up the hierarchy.
+    """
+    __slots__ = ('name', 'bases', 'members', 'kinds', 'instance_attributes',
+                 'open', 'mro', 'attributes')
+
+    __setattr__ = object.__setattr__
+
+    def __init__(self, name, bases=(), members=None, kinds=None,
+                 instance_attributes=None, open=False):
+        self.name = name
+        self.bases = tuple(bases)
+        self.members = {} if members is None else members
+        self.kinds = {} if kinds is None else kinds
+        self.instance_attributes = {} if instance_attributes is None else instance_attributes
+        self.open = open or any(base.open for base in self.bases)
+        self.mro = c3_mro(self)
+        self.attributes = None  # name -> (type, kind), once finished
+
+    def finish(self):
+        """Builds the attribute table. The members mustn't change after."""
+        self.attributes = self._flatten()
+
+    def _flatten(self):
+        if len(self.bases) == 1:
+            # the base's table already has the rest of the MRO in order
+            table = dict(self.bases[0].attributes)
+            mro = (self,)
+        else:
+            table = {}
+            mro = self.mro
+        for cls in reversed(mro):
+            for name, t in cls.instance_attributes.items():
+                table[name] = (t, None)
+            for name, t in cls.members.items():
+                table[name] = (t, cls.kinds.get(name))
+        return table
+
+    def lookup(self, name):
+        """The (type, kind) of attribute name, or None if it has none."""
+        if self.attributes is not None:
+            return self.attributes.get(name)
+        # still being defined, so the members are still changing; the bases
+        # are finished, though
+        if name in self.members:
+            return (self.members[name], self.kinds.get(name))
+        if name in self.instance_attributes:
+            return (self.instance_attributes[name], None)
+        if len(self.bases) == 1:
+            return self.bases[0].lookup(name)
+        for cls in self.mro[1:]:
+            if name in cls.members:
+                return (cls.members[name], cls.kinds.get(name))
+            if name in cls.instance_attributes:
+                return (cls.instance_attributes[name], None)
+        return None
+
+    def items(self):
+        """The (name, (type, kind)) pairs of every attribute."""
+        if self.attributes is not None:
+            return self.attributes.items()
+        return self._flatten().items()
+
+    def __reduce__(self):
+        if self is OBJECT:
+            return "OBJECT"  # unpickles as the one in this module
+        # the state goes in once the object exists, since the types of its
+        # methods refer back to it; the name goes in first, since unions
+        # holding instances of the class are sorted by it before then
+        return (_unpickle_class, (self.name,),
+                tuple(getattr(self, f) for f in self.__slots__))
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __str__(self):
+        return "type[%s]" % self.name
+
 
-    # TODO: support inheritance
-    # TODO: support multiple bases
-    # bases = []
-    inherits = None
+def _unpickle_class(name):
+    cls = object.__new__(ClassType)
+    cls.name = name
+    return cls
 
-    env = None
 
-    def __init__(self, inherits=None, env=None):
-        self.inherits = inherits
-        if env is not None:
-            self.env = env
+def c3_mro(cls):
+    """
+    The method resolution order of ClassType cls, by C3 linearization as
+    Python does it. Raises ValueError if there isn't a consistent one. Each
+    base's MRO is already worked out, so with a single base there is
+    nothing to merge; otherwise the merge keeps a count of the sequences
+    each class is in the tail of, rather than searching them every step.
+    """
+    bases = cls.bases
+    if len(set(bases)) != len(bases):
+        raise ValueError("Duplicate base class in %s" % cls.name)
+    if len(bases) == 1:
+        return (cls,) + bases[0].mro
+    sequences = [base.mro for base in bases] + [bases]
+    heads = [0] * len(sequences)
+    in_tails = {}
+    for seq in sequences:
+        for c in seq[1:]:
+            in_tails[c] = in_tails.get(c, 0) + 1
+    mro = [cls]
+    while True:
+        head = None
+        done = True
+        for seq, idx in zip(sequences, heads):
+            if idx < len(seq):
+                done = False
+                if not in_tails.get(seq[idx]):
+                    head = seq[idx]
+                    break
+        if done:
+            return tuple(mro)
+        if head is None:
+            raise ValueError("Cannot create a consistent method resolution order "
+                             "(MRO) for bases %s" %
+                             ", ".join(base.name for base in bases))
+        mro.append(head)
+        for i, seq in enumerate(sequences):
+            idx = heads[i]
+            if idx < len(seq) and seq[idx] is head:
+                heads[i] = idx = idx + 1
+                if idx < len(seq):
+                    in_tails[seq[idx]] -= 1
+
+
+class InstanceType(Type):
+    """An instance of the ClassType cls, or of any subclass of it."""
+    __slots__ = ('cls',)
+
+    def __new__(cls, class_t):
+        return cls._intern(class_t)
+
+    def accepts(self, T):
+        if isinstance(T, InstanceType):
+            return self.cls in T.cls.mro
+        # an annotation naming a class before it was defined
+        return T == self.cls.name
 
-    # TODO: implement this
     def __str__(self):
-        return "ClassType?"
+        return self.cls.name
+
+
+class ModuleType(Type):
+    """
+    An imported module. Its attributes are only loaded (by calling loader with
+    the module name) the first time one is asked for. A module from the
+    checked source tree has its exports as values and a version that changes
+    whenever their types do.
+    """
+    __slots__ = ('name', 'values', 'loader', 'version')
+
+    # modules are nominal, like classes
+    __setattr__ = object.__setattr__
+
+    def __init__(self, name, values=None, loader=None, version=None):
+        self.name = name
+        self.values = values
+        self.loader = loader
+        self.version = version
+
+    def attributes(self):
+        if self.values is None:
+            self.values = self.loader(self.name)
+        return self.values
+
+    def __reduce__(self):
+        return (ModuleType, (self.name, self.attributes(), None, self.version))
+
+    def __str__(self):
+        return "module %s" % self.name
 
 
 class AnyType(Type):
-    def __init__(self, magic_words=None):
+    __slots__ = ()
+
+    def __new__(cls, magic_words=None):
         if magic_words != "nuh-uh-uh":
             raise Exception("Shouldn't instantiate AnyType")
+        return cls._intern()
+
     def __str__(self):
         return "?"
 
@@ -86,24 +361,88 @@ class AnyType(Type):
         """
         return True
 
+    def __reduce__(self):
+        # unpickle back to the one and only instance
+        return "unknown"
+
 
 unknown = AnyType("nuh-uh-uh")
 
+# the attributes every object has, at the root of every class's MRO; not
+# __init__, though, which a class without one is called through as taking
+# no arguments
+OBJECT = ClassType("object", members={
+    name: unknown
+    for name in set(dir(object)) | {'__dict__', '__module__', '__weakref__'}
+    if name != '__init__'})
+OBJECT.finish()
+
 
 # need to pattern match on function args
-class Overload(set): # :: set(FuncType)
-    def for_args(self, ls):
-        possibilities = SomeType()
+class Overload(frozenset): # :: set(FuncType)
+    __slots__ = ()
+
+    def index(self):
+        """
+        The overloads grouped for for_args: by arity, then by the first
+        parameter when that's a concrete (str) type. Built once per distinct
+        Overload and kept in overload_indexes.
+        """
+        try:
+            return overload_indexes[self]
+        except KeyError:
+            pass
+        by_first = {}   # (arity, first param) -> [FuncType]
+        by_arity = {}   # arity -> [FuncType] whose first param isn't a str
+        any_arity = {}  # arity -> every FuncType of that arity
+        varargs = []
         for overload in self:
-            if len(overload.args) != len(ls):
+            if overload.varargs is not None:
+                varargs.append(overload)
+                continue
+            n = len(overload.args)
+            any_arity.setdefault(n, []).append(overload)
+            if n and isinstance(overload.args[0], str):
+                by_first.setdefault((n, overload.args[0]), []).append(overload)
+            else:
+                by_arity.setdefault(n, []).append(overload)
+        idx = overload_indexes[self] = (by_first, by_arity, any_arity, varargs)
+        return idx
+
+    def candidates(self, ls):
+        """The overloads that could possibly take arguments of types ls."""
+        by_first, by_arity, any_arity, varargs = self.index()
+        n = len(ls)
+        if n and isinstance(ls[0], str):
+            # a concrete type only fits a str param that's the same type
+            found = by_first.get((n, ls[0]), []) + by_arity.get(n, [])
+        else:
+            found = any_arity.get(n, [])
+        if varargs:
+            found = found + varargs
+        return found
+
+    def for_args(self, ls):
+        """
+        The return type of the overloads that take arguments of types ls (the
+        union, if several do). An overload that returns unknown is a catch-all
+        for calls the others can't describe, so it only counts when no other
+        one fits.
+        """
+        possibilities = set()
+        for overload in self.candidates(ls):
+            params = overload.params_for(len(ls))
+            if params is None:
                 continue
-            if all([type_fits(A, B) for A, B in zip(ls, overload.args)]):
+            if all([type_fits(A, B) for A, B in zip(ls, params)]):
                 possibilities.add(overload.ret)
+        if len(possibilities) > 1:
+            possibilities.discard(unknown)
         if len(possibilities) == 1:
             return possibilities.pop()
         if not possibilities:
             raise ValueError("Can't fit %s to %s", (ls, self))
-        return possibilities
+        return SomeType(possibilities)
 
     def accepts_args(self, ls):
         """
@@ -115,14 +454,26 @@ class Overload(set): # :: set(FuncType)
     def accepts(self, T):
         return any([type_fits(T, X) for X in self])
 
+    def __eq__(self, other):
+        # don't compare equal to a SomeType of the same functions
+        return type(other) is Overload and frozenset.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = frozenset.__hash__
+
+    def __repr__(self):
+        return "Overload({%s})" % ", ".join(sorted(map(repr, self)))
+
 
 class ListType(Type):
     # using a string here should be ok because other strings shouldn't find
     # their way into the type system
-    inner = "emptylist"
-    
-    def __init__(self, inner_t="emptylist"):
-        self.inner = inner_t
+    __slots__ = ('inner',)
+
+    def __new__(cls, inner_t="emptylist"):
+        return cls._intern(inner_t)
 
     def accepts(self, T):
         if isinstance(T, ListType):
@@ -140,15 +491,13 @@ class ListType(Type):
 
 
 class DictType(Type):
-    k = "emptydict"
-    v = "emptydict"
+    __slots__ = ('k', 'v')
 
-    def __init__(self, k_t="emptydict", v_t="emptydict"):
+    def __new__(cls, k_t="emptydict", v_t="emptydict"):
         # make sure they didn't give us k_t but not v_t
         if v_t == "emptydict" and k_t != v_t:
             raise ValueError("DictType requires both key and value type.")
-        self.k = k_t
-        self.v = v_t
+        return cls._intern(k_t, v_t)
 
     def accepts(self, T):
         # empty dict fits all DictType
@@ -162,24 +511,112 @@ class DictType(Type):
         return "{%s: %s}" % (self.k, self.v)
 
 
+class LRUCache():
+    """A bounded map that drops the least recently used entry when full."""
+    def __init__(self, maxsize=8192):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            try:
+                result = self.results[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def __setitem__(self, key, result):
+        with self.lock:
+            self.results[key] = result
+            if len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+    def __len__(self):
+        return len(self.results)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __getstate__(self):
+        # sent to worker processes along with whatever holds it
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class SubtypeCache(LRUCache):
+    """
+    Bounded LRU map of (A, B) -> type_fits(A, B). Types are interned and
+    immutable, so a result only goes stale when the builtin tables change, at
+    which point the cache is cleared.
+    """
+
+
+subtype_cache = SubtypeCache()
+
+
+class OverloadIndexes(LRUCache):
+    """Bounded LRU map of Overload -> its Overload.index()."""
+
+
+overload_indexes = OverloadIndexes()
+
+
 def type_fits(A, B):
     """
     Check whether type A is a valid B.
     A can be a valid B if any of the following are true:
       * A==B
-      * B is AnyType
-      * B is SomeType and A is in B
+      * A or B is AnyType
+      * A is SomeType and all of its members are valid Bs
+      * B is SomeType and A is a valid one of its members
       * B is Maybe(X) and A is None or X
+      * A is an instance of a class with B's class in its MRO
+    Results are memoized in subtype_cache.
     """
-    import inquisition
-    if inquisition.DEBUG_LEVEL > 2:
+    try:
+        return subtype_cache[A, B]
+    except KeyError:
+        pass
+    except TypeError:
+        # something unhashable snuck in; just don't cache it
+        return _type_fits(A, B)
+    result = _type_fits(A, B)
+    subtype_cache[A, B] = result
+    return result
+
+
+def _type_fits(A, B):
+    if debug_level.get() > 2:
         print("checking type_fits(%s, %s)?" % (A, B))
     if A == B:  # if B is a str or A==B
         return True
-    elif isinstance(B, str):
-        return False # by this point we know that A != B
+    elif A == unknown:
+        # we don't know what A is, so give it the benefit of the doubt
+        return True
     elif B == unknown:
         return True
+    elif type(A) is SomeType:
+        return all([type_fits(X, B) for X in A.members])
+    elif isinstance(B, str):
+        # by this point we know that A != B; but B may name A's class in an
+        # annotation from before the class was defined
+        return type(A) is InstanceType and any(cls.name == B for cls in A.cls.mro)
+    elif B is None:
+        return False
     else:  # assume that B is a Type sub-class
         return B.accepts(A)
 
@@ -189,36 +626,139 @@ class Maybe(Type):
     Represents a Nunnable type - a type that can be either the concrete type,
     or None. For example, Maybe(int) may be int or may be None.
     """
-    concrete = None
-    def __init__(self, concrete):
+    __slots__ = ('concrete',)
+
+    def __new__(cls, concrete):
         if concrete is None:
             raise ValueError("Can't have Maybe(None) - doesn't make sense")
-        self.concrete = concrete
+        return cls._intern(concrete)
 
     def accepts(self, T):
         return T is None or type_fits(T, self.concrete)
 
+    def __str__(self):
+        return "Maybe(%s)" % self.concrete
+
 
-SomeType = set
+# unions with more members than this are widened (see SomeType), by default
+MAX_UNION_SIZE = 16
 
+# the settings of the check running in this thread or task, which
+# inquisition.Checker sets around each file, since the types here have no
+# Env to find their checker through
+max_union_size = contextvars.ContextVar('max_union_size', default=MAX_UNION_SIZE)
+debug_level = contextvars.ContextVar('debug_level', default=0)
 
-def merge_types(A, B):
-    if isinstance(A, set):
-        if isinstance(B, set):
-            return A.union(B)
-        else:
-            newset = set(A)
-            newset.add(B)
-            return newset
-    elif isinstance(B, set):
-        newset = set(B)
-        newset.add(A)
-        return newset
-    else:
-        return set([A, B])
+
+class SomeType(Type):
+    """
+    A union: the value is one of members. Unions are canonical: nested
+    unions are flattened, members are deduplicated and sorted, a single
+    member is just that member, a union with unknown in it is unknown, and
+    the same members give the same object.
+
+    A union with more than max_union_size members is widened so that unions
+    on generated code stay small: lists merge into a list of the union of
+    their elements, dicts likewise, and anything else becomes unknown.
+    """
+    __slots__ = ('members',)
+
+    # frozenset(members, weakly like Type._interned) -> the canonical union
+    _unions = WeakTable()
+
+    def __new__(cls, members=()):
+        flat = set()
+        for m in members:
+            if type(m) is SomeType:
+                flat.update(m.members)
+            else:
+                flat.add(m)
+        if not flat:
+            raise ValueError("A union needs at least one member")
+        if unknown in flat:
+            return unknown  # could be anything, including the rest
+        if len(flat) == 1:
+            t, = flat
+            return t
+        if len(flat) > 2 and len(flat) > max_union_size.get():
+            return _widen(flat)
+        return cls._make(flat)
+
+    @classmethod
+    def _make(cls, flat):
+        key = frozenset([_ref(m) if isinstance(m, Type) else m for m in flat])
+        t = SomeType._unions.find(key)
+        if t is None:
+            with _intern_lock:
+                t = SomeType._unions.find(key)
+                if t is None:
+                    t = object.__new__(cls)
+                    object.__setattr__(t, 'members', tuple(sorted(flat, key=_sort_key)))
+                    SomeType._unions.keep(key, t)
+        return t
+
+    def accepts(self, T):
+        if type(T) is SomeType:
+            return all([self.accepts(X) for X in T.members])
+        return any([type_fits(T, X) for X in self.members])
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, T):
+        return T in self.members
+
+    def __str__(self):
+        return " | ".join(map(str, self.members))
 
 
-Num = set(['int', 'float'])
+def _sort_key(t):
+    return (type(t).__name__, repr(t))
+
+
+def _widen(members):
+    """A small type that accepts everything in members."""
+    if all(isinstance(m, ListType) for m in members):
+        inner = [m.inner for m in members if m.inner != "emptylist"]
+        return ListType(SomeType(inner))
+    if all(isinstance(m, DictType) for m in members):
+        items = [m for m in members if m.k != "emptydict"]
+        return DictType(SomeType([m.k for m in items]), SomeType([m.v for m in items]))
+    return unknown
+
+
+class MergeCache(LRUCache):
+    """
+    (A, B, max_union_size) -> merge_types(A, B), which is asked for over and
+    over.
+    """
+
+
+merge_cache = MergeCache()
+
+
+def merge_types(A, B):
+    """
+    The union of A and B. "noreturn" is nothing, so merging it with a type
+    gives that type.
+    """
+    if A == B or B == "noreturn":
+        return A
+    if A == "noreturn":
+        return B
+    key = (A, B, max_union_size.get())
+    try:
+        return merge_cache[key]
+    except KeyError:
+        pass
+    result = merge_cache[key] = SomeType([A, B])
+    return result
+
+
+Num = SomeType(['int', 'float'])
 
 
 class Heresy(Exception):
@@ -0,0 +1,190 @@
+"""
+A pre-pass that ties each name reference to the scope it is bound in, like
+CPython's symtable, but following inquisition's scopes rather than Python's:
+
+  * the module is a scope
+  * a function's arguments and body are one scope
+  * the body and the else of an if statement are each their own scope
+  * a class body is a scope, but, as in Python, not one that the functions
+    and classes defined in it can see
+
+Every ast.Name that is bound in some enclosing scope gets a `resolved_hops`
+attribute: how many scopes up from where it is used that binding lives. The
+checker passes that to Env.find, which can then index straight into the right
+frame. Names that aren't bound anywhere in the module (builtins, typos) are
+left alone and looked up the slow way.
+
+Every FunctionDef also gets a `sibling_refs` set: the names bound in the body
+it is defined in that it (or anything nested in it) refers to, which is what
+the checker's Siblings needs to know without walking the def again.
+"""
+import ast
+
+
+def resolve(stmts):
+    """Annotates the names in a module body."""
+    _resolve_block(stmts, _Stack())
+
+
+class _Stack():
+    """
+    The scopes enclosing the code being resolved, innermost last, indexed by
+    name so that finding a binding doesn't mean looking through every scope
+    (an elif ladder is thousands of scopes deep).
+    """
+    def __init__(self):
+        self.scopes = []
+        self.depths = {}  # name -> depths of the scopes that bind it
+        # the def whose body each scope is, if it is defined in the scope
+        # before it, else None
+        self.owners = []
+
+    def push(self, scope, owner=None):
+        for name in scope:
+            self.depths.setdefault(name, []).append(len(self.scopes))
+        self.scopes.append(scope)
+        self.owners.append(owner)
+
+    def pop(self):
+        self.owners.pop()
+        for name in self.scopes.pop():
+            depths = self.depths[name]
+            depths.pop()
+            if not depths:
+                del self.depths[name]
+
+    def hops(self, name):
+        """
+        How many scopes up name is bound, or None if it isn't. A use of a
+        name from an enclosing scope is noted on the def defined there that
+        it is inside (see sibling_refs).
+        """
+        depths = self.depths.get(name)
+        if depths is None:
+            return None
+        depth = depths[-1]
+        if depth + 1 < len(self.owners):
+            owner = self.owners[depth + 1]
+            if owner is not None:
+                owner.sibling_refs.add(name)
+        return len(self.scopes) - 1 - depth
+
+
+def _resolve_block(stmts, stack, bound=(), owner=None):
+    scope = set(bound)
+    _collect_bindings(stmts, scope)
+    stack.push(scope, owner)
+    for stmt in stmts:
+        _resolve_stmt(stmt, stack)
+    stack.pop()
+
+
+def _collect_bindings(stmts, scope):
+    for stmt in stmts:
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            scope.add(stmt.name)
+        elif isinstance(stmt, ast.Assign):
+            for target in stmt.targets:
+                if isinstance(target, ast.Name):
+                    scope.add(target.id)
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                scope.add(alias.asname or alias.name.split(".")[0])
+
+
+def _resolve_stmt(stmt, stack):
+    if isinstance(stmt, ast.FunctionDef):
+        stmt.sibling_refs = set()
+        _resolve_block(stmt.body, stack, [arg.arg for arg in stmt.args.args], stmt)
+    elif isinstance(stmt, ast.ClassDef):
+        _annotate(stmt.bases, stack)
+        _resolve_class_body(stmt.body, stack)
+    elif isinstance(stmt, ast.If):
+        # an elif is an if alone in an else scope; go down the ladder in a
+        # loop, pushing the (empty) else scopes, rather than recursing
+        rungs = 0
+        while len(stmt.orelse) == 1 and isinstance(stmt.orelse[0], ast.If):
+            _annotate([stmt.test], stack)
+            _resolve_block(stmt.body, stack)
+            stack.push(())
+            rungs += 1
+            stmt = stmt.orelse[0]
+        _annotate([stmt.test], stack)
+        _resolve_block(stmt.body, stack)
+        if stmt.orelse:
+            _resolve_block(stmt.orelse, stack)
+        for _ in range(rungs):
+            stack.pop()
+    else:
+        _annotate([stmt], stack)
+
+
+def _resolve_class_body(stmts, stack):
+    """
+    The bodies of the functions and classes in a class body are resolved
+    with the class's scope taken off the stack, since they can't see it.
+    """
+    scope = set()
+    _collect_bindings(stmts, scope)
+    stack.push(scope)
+    for stmt in stmts:
+        if isinstance(stmt, ast.FunctionDef):
+            stack.pop()
+            # a method's body can't see the class body, so it has no
+            # siblings to refer to
+            stmt.sibling_refs = set()
+            _resolve_block(stmt.body, stack, [arg.arg for arg in stmt.args.args])
+            stack.push(scope)
+        elif isinstance(stmt, ast.ClassDef):
+            _annotate(stmt.bases, stack)
+            stack.pop()
+            _resolve_class_body(stmt.body, stack)
+            stack.push(scope)
+        else:
+            _resolve_stmt(stmt, stack)
+    stack.pop()
+
+
+# expressions that would get their own scope in Python; the checker doesn't
+# look inside them, so neither do we
+_SCOPED_EXPRS = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _annotate(nodes, stack):
+    """
+    Annotates the names in nodes without going into nested statement bodies,
+    which the checker doesn't evaluate in this scope. The walk keeps a stack
+    of child iterators rather than of nodes, so a literal with 100k elements
+    doesn't mean a 100k-entry todo list.
+    """
+    todo = [iter(nodes)]
+    while todo:
+        node = next(todo[-1], _DONE)
+        if node is _DONE:
+            todo.pop()
+            continue
+        kind = type(node)
+        if kind is ast.Name:
+            hops = stack.hops(node.id)
+            if hops is not None:
+                node.resolved_hops = hops
+            continue
+        if kind is ast.Constant or not isinstance(node, ast.AST) \
+                or isinstance(node, _SCOPED_EXPRS):
+            continue
+        todo.append(_children(node))
+
+
+# marks the end of _annotate's child iterators, since None can be a child
+_DONE = object()
+
+
+def _children(node):
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if type(value) is list:
+            if value and isinstance(value[0], ast.stmt):
+                continue
+            yield from value
+        elif isinstance(value, ast.AST):
+            yield value
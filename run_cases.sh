@@ -1,2 +1,3 @@
 #!/bin/bash
-python test_cases.py $* cases/*.py
+# every case file, and every directory of cases (checked as one tree)
+python test_cases.py "$@" cases/*.py $(find cases -mindepth 1 -maxdepth 1 -type d ! -name __pycache__ | sort)
@@ -0,0 +1,211 @@
+"""
+Numbers on where checking time goes, for --stats.
+
+Nothing here runs unless instrument is called: it wraps the checker's node
+handlers, get_func_type_for_real and pypes.type_fits with timing versions, so
+a normal run doesn't even check a flag. The timing versions count towards the
+Stats of the check running in their thread (current), if it has one.
+"""
+import contextvars
+import re
+import resource
+import sys
+import threading
+import time
+
+import pypes
+
+
+# the Stats of the check running in this thread or task, which
+# inquisition.Checker sets around each file
+current = contextvars.ContextVar('stats', default=None)
+
+
+class Stats():
+    """
+    Counts and times, per Checker. take() hands the numbers over in a
+    picklable form (and starts over) so that worker processes can send theirs
+    back to be merged.
+    """
+    def __init__(self):
+        self.path = "?"
+        self.reset()
+
+    def reset(self):
+        self.nodes = {}         # node kind -> [calls, seconds including children]
+        self.functions = {}     # "path:line name" -> [calls, seconds]
+        self.type_fits_calls = 0
+        self.lazy_errors = {}   # reason -> count
+        self.stacks = {}        # "frame;frame;..." -> seconds not spent in children
+        self.frames = []
+        self.child_seconds = []
+
+    def _time(self, table, key, frame, f, args):
+        self.frames.append(frame)
+        self.child_seconds.append(0.0)
+        start = time.perf_counter()
+        try:
+            return f(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack = ";".join([self.path] + self.frames)
+            self.frames.pop()
+            own = elapsed - self.child_seconds.pop()
+            if self.child_seconds:
+                self.child_seconds[-1] += elapsed
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+            counts = table.get(key)
+            if counts is None:
+                counts = table[key] = [0, 0.0]
+            counts[0] += 1
+            counts[1] += elapsed
+
+    def take(self):
+        data = {
+            "nodes": self.nodes,
+            "functions": self.functions,
+            "type_fits_calls": self.type_fits_calls,
+            "lazy_errors": self.lazy_errors,
+            "stacks": self.stacks,
+            "peak_rss_kib": peak_rss_kib()
+        }
+        self.reset()
+        return data
+
+
+# the checker modules instrument has wrapped, so each is wrapped once
+_instrumented = set()
+_instrument_lock = threading.Lock()
+
+
+def instrument(checker):
+    """Instruments the checker module, e.g. inquisition, once per process."""
+    with _instrument_lock:
+        if checker.__name__ in _instrumented:
+            return
+        _instrumented.add(checker.__name__)
+    lazy_error = checker.LazyError
+
+    def count_lazy_errors(f):
+        def counted(*args):
+            try:
+                return f(*args)
+            except lazy_error as e:
+                stats = current.get()
+                if stats is not None and not getattr(e, "counted", False):
+                    e.counted = True
+                    # drop object addresses so equal reasons group together
+                    reason = re.sub(r" at 0x[0-9a-f]+", "", e.message)
+                    stats.lazy_errors[reason] = stats.lazy_errors.get(reason, 0) + 1
+                raise
+        return counted
+
+    def wrap_node(node_type, f):
+        kind = node_type.__name__
+
+        def timed(expr, *args):
+            stats = current.get()
+            if stats is None:
+                return f(expr, *args)
+            return stats._time(stats.nodes, kind,
+                               "%s:%s" % (kind, getattr(expr, 'lineno', '?')),
+                               f, (expr,) + args)
+        return count_lazy_errors(timed)
+    checker.instrument(wrap_node)
+    # run_through reads signatures without going through a handler
+    checker.get_func_type = count_lazy_errors(checker.get_func_type)
+
+    check_function = checker.get_func_type_for_real
+
+    def timed_function(expr, env):
+        stats = current.get()
+        if stats is None:
+            return check_function(expr, env)
+        name = "%s:%d %s" % (stats.path, expr.lineno, expr.name)
+        return stats._time(stats.functions, name,
+                           "def %s:%d" % (expr.name, expr.lineno),
+                           check_function, (expr, env))
+    checker.get_func_type_for_real = timed_function
+
+    type_fits = pypes.type_fits
+
+    def counted_type_fits(A, B):
+        stats = current.get()
+        if stats is not None:
+            stats.type_fits_calls += 1
+        return type_fits(A, B)
+    pypes.type_fits = counted_type_fits
+
+
+def merge(total, data):
+    """Adds the numbers from one take() into total, another take() result."""
+    for field in ("nodes", "functions"):
+        for key, (calls, seconds) in data[field].items():
+            counts = total[field].setdefault(key, [0, 0.0])
+            counts[0] += calls
+            counts[1] += seconds
+    for field in ("lazy_errors", "stacks"):
+        for key, value in data[field].items():
+            total[field][key] = total[field].get(key, 0) + value
+    total["type_fits_calls"] += data["type_fits_calls"]
+    total["peak_rss_kib"] = max(total["peak_rss_kib"], data["peak_rss_kib"])
+
+
+def empty():
+    return {"nodes": {}, "functions": {}, "type_fits_calls": 0,
+            "lazy_errors": {}, "stacks": {}, "peak_rss_kib": 0}
+
+
+# the peak RSS when this process started checking, see mark_rss
+_rss_start = 0
+
+
+def mark_rss():
+    """
+    Makes peak_rss_kib count from the peak so far. A forked worker starts out
+    with its parent's memory, and its peak with it, which isn't the worker's
+    own doing.
+    """
+    global _rss_start
+    _rss_start = _max_rss()
+
+
+def peak_rss_kib():
+    """How far the peak RSS has grown since mark_rss (or the start), in KiB."""
+    return _max_rss() - _rss_start
+
+
+def _max_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024  # bytes there, KiB everywhere else
+    return peak
+
+
+def report(data, out, top=20):
+    print("Node kinds (calls, seconds incl. children):", file=out)
+    for kind, (calls, seconds) in sorted(data["nodes"].items(),
+                                         key=lambda kv: -kv[1][1]):
+        print("  %-16s %9d %10.4f" % (kind, calls, seconds), file=out)
+
+    print("Slowest functions:", file=out)
+    for name, (calls, seconds) in sorted(data["functions"].items(),
+                                         key=lambda kv: -kv[1][1])[:top]:
+        print("  %-40s %5d %10.4f" % (name, calls, seconds), file=out)
+
+    print("type_fits calls: %d" % data["type_fits_calls"], file=out)
+
+    print("Unimplemented (LazyError) by reason:", file=out)
+    for reason, count in sorted(data["lazy_errors"].items(), key=lambda kv: -kv[1]):
+        print("  %6d %s" % (count, reason), file=out)
+
+    print("Peak RSS: %.1f MiB" % (data["peak_rss_kib"] / 1024), file=out)
+
+
+def write_stacks(data, f):
+    """
+    Writes collapsed stacks, one "frame;frame;... microseconds" line each, as
+    read by flamegraph.pl and speedscope.
+    """
+    for stack, seconds in sorted(data["stacks"].items()):
+        f.write("%s %d\n" % (stack, round(seconds * 1e6)))
@@ -0,0 +1,133 @@
+"""
+Reads a module one top-level statement at a time, for --low-memory.
+
+ast.parse needs the whole source and builds the whole tree at once, which for
+a generated module of hundreds of megabytes is most of the checker's memory.
+Here lines are read until they make up a complete top-level statement, which
+is parsed on its own. Only one statement's source and tree exist at a time,
+as long as the caller lets go of each before asking for the next.
+
+Line numbers in each statement's tree count from the start of the statement;
+add the offset that comes with it to get the line in the file. (Moving every
+node with ast.increment_lineno costs more than the rest of the parse.)
+
+Every parse goes through parse(), which also copes with generated code that
+nests deeper than the recursion limit allows.
+"""
+import ast
+import re
+import sys
+import threading
+import tokenize
+
+import comments
+
+# CPython builds the tree with C code that recurses once per level of
+# nesting and gives up (RecursionError) at three times the recursion limit,
+# so generated code like a 5,000-term a + b + ... chain doesn't parse under
+# the default limit. Such code is parsed again with the limit raised to
+# this, in a thread of its own with a stack that has room for that many
+# levels: the caller's stack (the main thread's, or a worker thread's) may
+# not, and running off it is a segfault rather than an exception.
+PARSE_RECURSION_LIMIT = 100000
+PARSE_STACK_SIZE = 256 * 1024 * 1024
+
+_limit_lock = threading.Lock()
+
+
+def parse(source, filename="<unknown>"):
+    """
+    ast.parse, with room for deeply nested code. Code nested too deep even
+    for that still raises RecursionError (or MemoryError). Source with null
+    bytes raises SyntaxError, as it does in later Pythons.
+    """
+    try:
+        return ast.parse(source, filename=filename)
+    except RecursionError as e:
+        too_deep = e
+    except ValueError as e:
+        raise SyntaxError(str(e)) from e
+    # the recursion limit is the whole process', so raising it is kept as
+    # rare and as short as it can be
+    outcome = []
+
+    def deep_parse():
+        try:
+            outcome.append(ast.parse(source, filename=filename))
+        except BaseException as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=deep_parse, name="deep parse")
+    with _limit_lock:
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, PARSE_RECURSION_LIMIT))
+        try:
+            old_stack_size = threading.stack_size(PARSE_STACK_SIZE)
+            try:
+                thread.start()
+            finally:
+                threading.stack_size(old_stack_size)
+            thread.join()
+        except (RuntimeError, ValueError):
+            # no thread with a stack that big to be had here
+            raise too_deep
+        finally:
+            sys.setrecursionlimit(limit)
+    if isinstance(outcome[0], BaseException):
+        raise outcome[0]
+    return outcome[0]
+
+
+# lines that carry on the statement before them rather than start a new one
+_CONTINUATION = re.compile(r"(else|elif|except|finally)\b|[\s#)\]}]|$")
+
+
+def statements(path):
+    """
+    Yields (line offset, statements) for each top-level statement of the
+    module at path. There is usually one statement; there can be more if
+    one of them contains lines that look like they start a statement, like
+    a multi-line string.
+    """
+    with tokenize.open(path) as f:
+        lines = []
+        start = 1
+        retry_at = 0  # don't try parsing again until there are this many lines
+        for lineno, line in enumerate(f, 1):
+            if len(lines) >= retry_at and not _CONTINUATION.match(line):
+                body = _parse(lines, path)
+                if body is None:
+                    # not a whole statement yet; back off so that parsing
+                    # a long one over and over doesn't take quadratic time
+                    retry_at = 2 * len(lines)
+                else:
+                    if body:
+                        yield start - 1, body
+                    lines = []
+                    start = lineno
+                    retry_at = 0
+            lines.append(line)
+        if lines:
+            source = "".join(lines)
+            try:
+                body = parse(source, path).body
+            except SyntaxError as e:
+                if e.lineno is not None:
+                    e.lineno += start - 1
+                raise
+            comments.attach(body, comments.grab_types(source.encode()))
+            if body:
+                yield start - 1, body
+
+
+def _parse(lines, path):
+    """The statements in lines, or None if they don't parse (yet)."""
+    if not lines:
+        return []
+    source = "".join(lines)
+    try:
+        body = parse(source, path).body
+    except SyntaxError:
+        return None
+    comments.attach(body, comments.grab_types(source.encode()))
+    return body
@@ -1,44 +1,101 @@
-import ast
+import argparse
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
 import re
 import sys
+import time
 
 import inquisition
-from pypes import Heresy
-from env import Env
 
 VERBOSE = False
 
-def test_file(filename):
+# where --update-baseline keeps how long each case took
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".case_timings.json")
 
+
+def test_file(filename, repeat=1, checker=None):
+    """
+    Checks one case file. Returns whether it passed, what to print about it,
+    and the best time it took to check out of repeat runs.
+    """
+    if checker is None:
+        checker = new_checker()
+    messages = []
     ALL_GOOD = True
 
-    with open(filename, 'r') as f:
-        f_ast = ast.parse(f.read())
+    with open(filename, 'rb') as f:
+        contents = f.read()
+    error_lines = collect_error_lines(contents.decode().splitlines())
 
-    with open(filename, 'r') as f:
-        f_lines = f.readlines()
-        error_lines = collect_error_lines(f_lines)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = checker.check_file(filename, contents=contents)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
 
     type_errors = {}
-    env = Env()
-    results = inquisition.run_through(f_ast.body, env, top_level=True, catch_errors=True)
-    for e in results['errors']:
-        type_errors[e.ast_obj.lineno] = str(e)
+    for d in result['errors']:
+        type_errors[d.line] = str(d)
 
     for k, v in type_errors.items():
         if k not in error_lines:
             ALL_GOOD = False
-            print("False alarm on line %d: %s" % (k, v))
+            messages.append("False alarm on line %d: %s" % (k, v))
         elif VERBOSE:
-            print("Caught error on line %d: %s" % (k, v))
+            messages.append("Caught error on line %d: %s" % (k, v))
 
     for k, v in error_lines.items():
         if k not in type_errors:
             ALL_GOOD = False
-            print("Didn't catch line %d: %s" % (k, v))
+            messages.append("Didn't catch line %d: %s" % (k, v))
+
+    return ALL_GOOD, messages, best
+
+
+def test_dir(dirname, repeat=1, checker=None):
+    """
+    Checks all the files under dirname together, so that they can import
+    each other.
+    """
+    if checker is None:
+        checker = new_checker()
+    messages = []
+    ALL_GOOD = True
+
+    files = inquisition.collect_files([dirname])
+    best = None
+    for _ in range(repeat):
+        type_errors = {f: {} for f in files}
+        start = time.perf_counter()
+        for result in checker.check_files(files):
+            for d in result['errors']:
+                type_errors[d.path][d.line] = str(d)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    for f in files:
+        with open(f, 'r') as source:
+            error_lines = collect_error_lines(source.read().splitlines())
+
+        for k, v in type_errors[f].items():
+            if k not in error_lines:
+                ALL_GOOD = False
+                messages.append("False alarm in %s on line %d: %s" % (f, k, v))
+            elif VERBOSE:
+                messages.append("Caught error in %s on line %d: %s" % (f, k, v))
+
+        for k, v in error_lines.items():
+            if k not in type_errors[f]:
+                ALL_GOOD = False
+                messages.append("Didn't catch %s line %d: %s" % (f, k, v))
+
+    return ALL_GOOD, messages, best
 
-    return ALL_GOOD
- 
 
 def collect_error_lines(lines):
     error_pattern = re.compile('##ERROR\\s+(.*)$')
@@ -51,14 +108,112 @@ def collect_error_lines(lines):
     return error_lines
 
 
-if __name__ == "__main__":
+def new_checker():
+    """A Checker for the cases, which traces what it does when VERBOSE."""
+    return inquisition.Checker(debug_level=3 if VERBOSE else 0)
+
+
+def run_case(case, repeat=1, checker=None):
+    if os.path.isdir(case):
+        return test_dir(case, repeat, checker)
+    return test_file(case, repeat, checker)
+
+
+def _init_worker(verbose):
+    global VERBOSE
+    VERBOSE = verbose
+
+
+def slowdown(seconds, baseline, factor, min_seconds):
+    """
+    How many times slower seconds is than baseline, if that's more than
+    factor and by more than min_seconds (tiny cases are mostly noise), or
+    None.
+    """
+    if baseline is None or seconds - baseline < min_seconds:
+        return None
+    if seconds > baseline * factor:
+        return seconds / baseline if baseline else float("inf")
+    return None
+
+
+def main(argv):
+    global VERBOSE
+    parser = argparse.ArgumentParser(description="Run the type checker's test cases.")
+    parser.add_argument("cases", nargs="*", metavar="case",
+                        help="case files, or directories checked as one tree")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="also print caught errors and trace the checker")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("-t", "--threads", action="store_true",
+                        help="check the cases in threads sharing one checker instead")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="times to check each case; the best time is kept")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="case timings to compare against (default: %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write this run's timings to --baseline")
+    parser.add_argument("--slowdown-factor", type=float, default=3.0,
+                        help="fail a case that got this many times slower (default: %(default)s)")
+    # most cases take well under a millisecond, where a few hundred
+    # microseconds is timer and scheduling noise rather than the checker
+    parser.add_argument("--min-slowdown", type=float, default=0.002, metavar="SECONDS",
+                        help="ignore slowdowns smaller than this (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        VERBOSE = True
+        args.jobs = 1  # keep the checker's trace next to its case
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    def results():
+        if args.jobs <= 1:
+            for case in args.cases:
+                yield run_case(case, args.repeat)
+            return
+        if args.threads:
+            checker = new_checker()
+            with multiprocessing.pool.ThreadPool(args.jobs) as pool:
+                yield from pool.starmap(run_case, [(case, args.repeat, checker)
+                                                   for case in args.cases])
+            return
+        with multiprocessing.Pool(args.jobs, initializer=_init_worker,
+                                  initargs=(VERBOSE,)) as pool:
+            yield from pool.starmap(run_case, [(case, args.repeat) for case in args.cases])
+
     ALL_GOOD = True
-    for f in sys.argv[1:]:
-        if f == '-v':
-            VERBOSE = True
-            inquisition.DEBUG_LEVEL = 3
-            continue
-        print("---> " + f)
-        ALL_GOOD = test_file(f) and ALL_GOOD
+    timings = {}
+    for case, (ok, messages, seconds) in zip(args.cases, results()):
+        print("---> " + case)
+        for message in messages:
+            print(message)
+        timings[case] = seconds
+        slower = None
+        if not args.update_baseline:
+            slower = slowdown(seconds, baseline.get(case), args.slowdown_factor,
+                              args.min_slowdown)
+        if slower is not None:
+            ok = False
+            print("Took %.4fs, %.1fx the baseline %.4fs" % (seconds, slower, baseline[case]))
+        elif VERBOSE:
+            print("Took %.4fs" % seconds)
+        ALL_GOOD = ok and ALL_GOOD
         print()
-    sys.exit(not ALL_GOOD)
+
+    if args.update_baseline:
+        # only the cases that were run are updated
+        baseline.update((case, round(seconds, 6)) for case, seconds in timings.items())
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    return ALL_GOOD
+
+
+if __name__ == "__main__":
+    sys.exit(not main(sys.argv[1:]))
@@ -1,3 +1,4 @@
+import pypes
 from pypes import DictType, FuncType, SomeType, Overload, unknown
 
 # int binops depend on the second type
@@ -7,7 +8,23 @@ int_binop_t = Overload([
     FuncType(['int', 'complex'], 'complex')
 ])
 
-float_binop_t = FuncType(['float', 'float'], 'float')
+int_div_t = Overload([
+    FuncType(['int', 'int'], 'float'),
+    FuncType(['int', 'float'], 'float'),
+    FuncType(['int', 'complex'], 'complex')
+])
+
+float_binop_t = Overload([
+    FuncType(['float', 'int'], 'float'),
+    FuncType(['float', 'float'], 'float'),
+    FuncType(['float', 'complex'], 'complex')
+])
+
+complex_binop_t = Overload([
+    FuncType(['complex', 'int'], 'complex'),
+    FuncType(['complex', 'float'], 'complex'),
+    FuncType(['complex', 'complex'], 'complex')
+])
 
 classes = {
 #    'dict': {
@@ -16,16 +33,55 @@ classes = {
         "_": Overload([FuncType([], 'float'), FuncType([unknown], 'float')]),
         "__add__": float_binop_t,
         "__mul__": float_binop_t,
-        "__sub__": float_binop_t
+        "__sub__": float_binop_t,
+        "__truediv__": float_binop_t
     },
     'int': {
         "_": Overload([FuncType([], 'int'), FuncType([unknown], 'int')]),
         "__add__": int_binop_t,
         "__mul__": int_binop_t,
-        "__sub__": int_binop_t
+        "__sub__": int_binop_t,
+        "__truediv__": int_div_t
+    },
+    'complex': {
+        "_": Overload([FuncType([], 'complex'), FuncType([unknown], 'complex')]),
+        "__add__": complex_binop_t,
+        "__mul__": complex_binop_t,
+        "__sub__": complex_binop_t,
+        "__truediv__": complex_binop_t
     },
 }
 
-funcs = {
-    'print': FuncType([unknown], None)
-}
+NUMERIC = ('int', 'float', 'complex')
+
+# (method, left type, right type) -> result type, for every pairing of
+# numeric types that works, so arithmetic doesn't need to go through overloads
+numeric_binops = {}
+
+
+def build_numeric_binops():
+    numeric_binops.clear()
+    for left in NUMERIC:
+        for method, binop_t in classes.get(left, {}).items():
+            if not method.startswith("__"):
+                continue
+            for right in NUMERIC:
+                try:
+                    numeric_binops[method, left, right] = binop_t.for_args([left, right])
+                except ValueError:
+                    pass
+
+
+build_numeric_binops()
+
+# builtin functions (print, len, ...) are in stubs/builtins.pyi
+
+
+def register_class(name, methods):
+    """
+    Adds or replaces a builtin class. Cached subtype results may depend on the
+    old table, so they're thrown away.
+    """
+    classes[name] = methods
+    pypes.subtype_cache.clear()
+    build_numeric_binops()
@@ -0,0 +1,106 @@
+"""
+Type stubs for builtins and standard library modules.
+
+Each module has a stub in typiary/stubs/<module>.pyi, written as ordinary
+Python declarations with inquisition's annotation syntax:
+
+    def len(x: Any) -> int: ...
+    argv: [str]
+
+Several defs with the same name make an Overload. A stub is only read when
+something refers to its module, and the parsed result is pickled into
+stubs/__pycache__ so later runs skip parsing. The pickle is keyed on the stub
+file's size and mtime and the checker version.
+"""
+import ast
+import os
+import pickle
+import tempfile
+
+from pypes import FuncType, Overload, unknown
+
+
+STUB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+CACHE_DIR = os.path.join(STUB_DIR, "__pycache__")
+
+
+class StubLibrary():
+    """
+    annotation_to_type turns an annotation AST into a type; it's passed in
+    because it lives in inquisition, which imports typiary.
+    """
+    def __init__(self, annotation_to_type, version, stub_dir=STUB_DIR):
+        self.annotation_to_type = annotation_to_type
+        self.version = version
+        self.stub_dir = stub_dir
+        self.modules = {}
+
+    def _path(self, module):
+        return os.path.join(self.stub_dir, module + ".pyi")
+
+    def has_module(self, module):
+        return module in self.modules or os.path.exists(self._path(module))
+
+    def load(self, module):
+        """Returns a dict of the names in module's stub and their types."""
+        values = self.modules.get(module)
+        if values is None:
+            # setdefault so that threads loading it at once agree on one dict
+            values = self.modules.setdefault(module, self._load(module))
+        return values
+
+    def _load(self, module):
+        path = self._path(module)
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns, self.version)
+        cache_path = os.path.join(os.path.dirname(path), "__pycache__",
+                                  module + ".pickle")
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_stamp, values = pickle.load(f)
+            if cached_stamp == stamp:
+                return values
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            pass
+
+        values = self._parse(path)
+
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((stamp, values), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass  # read-only install; parse again next time
+        return values
+
+    def _parse(self, path):
+        with open(path, 'r') as f:
+            stub = ast.parse(f.read(), filename=path)
+
+        values = {}
+        for stmt in stub.body:
+            if isinstance(stmt, ast.FunctionDef):
+                t = self._func_type(stmt)
+                if stmt.name in values:
+                    other = values[stmt.name]
+                    if not isinstance(other, Overload):
+                        other = Overload([other])
+                    t = Overload(other | {t})
+                values[stmt.name] = t
+            elif isinstance(stmt, ast.AnnAssign):
+                values[stmt.target.id] = self.annotation_to_type(stmt.annotation)
+        return values
+
+    def _func_type(self, stmt):
+        args = [self._annotation(arg.annotation) for arg in stmt.args.args]
+        varargs = None
+        if stmt.args.vararg is not None:
+            varargs = self._annotation(stmt.args.vararg.annotation)
+        return FuncType(args, self._annotation(stmt.returns), varargs=varargs)
+
+    def _annotation(self, annotation):
+        if annotation is None:
+            return unknown
+        return self.annotation_to_type(annotation)
@@ -0,0 +1,100 @@
+# Builtin functions. Classes' methods (int.__add__ etc.) are in builtins.py.
+# An overload returning Any is only used for calls no other overload fits.
+
+def abs(x: int) -> int: ...
+def abs(x: float) -> float: ...
+def all(xs: Any) -> bool: ...
+def any(xs: Any) -> bool: ...
+def ascii(x: Any) -> str: ...
+def bin(x: int) -> str: ...
+def bool() -> bool: ...
+def bool(x: Any) -> bool: ...
+def bytes() -> bytes: ...
+def bytes(x: Any) -> bytes: ...
+def bytes(x: Any, encoding: str) -> bytes: ...
+def bytes(x: Any, encoding: str, errors: str) -> bytes: ...
+def callable(x: Any) -> bool: ...
+def chr(i: int) -> str: ...
+def complex() -> complex: ...
+def complex(x: Any) -> complex: ...
+def complex(real: Any, imag: Any) -> complex: ...
+def dict() -> {Any: Any}: ...
+def dict(x: Any) -> {Any: Any}: ...
+def dir() -> [str]: ...
+def dir(x: Any) -> [str]: ...
+def divmod(a: Any, b: Any) -> Any: ...
+def enumerate(xs: Any) -> Any: ...
+def enumerate(xs: Any, start: int) -> Any: ...
+def eval(source: str) -> Any: ...
+def exit() -> None: ...
+def exit(code: Any) -> None: ...
+def filter(f: Any, xs: Any) -> Any: ...
+def float() -> float: ...
+def float(x: Any) -> float: ...
+def format(x: Any) -> str: ...
+def format(x: Any, spec: str) -> str: ...
+def getattr(x: Any, name: str) -> Any: ...
+def getattr(x: Any, name: str, default: Any) -> Any: ...
+def globals() -> {str: Any}: ...
+def hasattr(x: Any, name: str) -> bool: ...
+def hash(x: Any) -> int: ...
+def hex(x: int) -> str: ...
+def id(x: Any) -> int: ...
+def input() -> str: ...
+def input(prompt: Any) -> str: ...
+def int() -> int: ...
+def int(x: Any) -> int: ...
+def int(x: str, base: int) -> int: ...
+def isinstance(x: Any, t: Any) -> bool: ...
+def issubclass(x: Any, t: Any) -> bool: ...
+def iter(x: Any) -> Any: ...
+def iter(f: Any, sentinel: Any) -> Any: ...
+def len(x: Any) -> int: ...
+def list() -> [Any]: ...
+def list(xs: Any) -> [Any]: ...
+def locals() -> {str: Any}: ...
+def map(f: Any, *xs: Any) -> Any: ...
+def max(x: Any, *xs: Any) -> Any: ...
+def min(x: Any, *xs: Any) -> Any: ...
+def next(it: Any) -> Any: ...
+def next(it: Any, default: Any) -> Any: ...
+def object() -> Any: ...
+def oct(x: int) -> str: ...
+def open(path: Any) -> Any: ...
+def open(path: Any, mode: str) -> Any: ...
+def ord(c: str) -> int: ...
+def pow(x: int, y: int) -> int: ...
+def pow(x: float, y: float) -> float: ...
+def pow(x: float, y: int) -> float: ...
+def pow(x: int, y: float) -> float: ...
+def pow(x: int, y: int, mod: int) -> int: ...
+def pow(x: Any, y: Any) -> Any: ...
+def pow(x: Any, y: Any, mod: Any) -> Any: ...
+def print(*args: Any) -> None: ...
+def range(stop: int) -> Any: ...
+def range(start: int, stop: int) -> Any: ...
+def range(start: int, stop: int, step: int) -> Any: ...
+def repr(x: Any) -> str: ...
+def reversed(xs: Any) -> Any: ...
+def round(x: float) -> int: ...
+def round(x: int) -> int: ...
+def round(x: float, digits: int) -> float: ...
+def set() -> Any: ...
+def set(xs: Any) -> Any: ...
+def setattr(x: Any, name: str, value: Any) -> None: ...
+def sorted(xs: Any) -> [Any]: ...
+def str() -> str: ...
+def str(x: Any) -> str: ...
+def str(x: Any, encoding: str) -> str: ...
+def str(x: Any, encoding: str, errors: str) -> str: ...
+def sum(xs: [int]) -> int: ...
+def sum(xs: [float]) -> float: ...
+def sum(xs: Any) -> Any: ...
+def sum(xs: Any, start: Any) -> Any: ...
+def super(*args: Any) -> Any: ...
+def tuple() -> Any: ...
+def tuple(xs: Any) -> Any: ...
+def type(x: Any) -> Any: ...
+def type(name: str, bases: Any, namespace: Any) -> Any: ...
+def vars(x: Any) -> {str: Any}: ...
+def zip(*xs: Any) -> Any: ...
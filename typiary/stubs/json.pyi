@@ -0,0 +1,4 @@
+def dumps(obj: Any) -> str: ...
+def loads(s: Any) -> Any: ...
+def dump(obj: Any, fp: Any) -> None: ...
+def load(fp: Any) -> Any: ...
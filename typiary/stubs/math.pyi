@@ -0,0 +1,39 @@
+pi: float
+e: float
+tau: float
+inf: float
+nan: float
+
+def ceil(x: int) -> int: ...
+def ceil(x: float) -> int: ...
+def floor(x: int) -> int: ...
+def floor(x: float) -> int: ...
+def trunc(x: float) -> int: ...
+def fabs(x: int) -> float: ...
+def fabs(x: float) -> float: ...
+def sqrt(x: int) -> float: ...
+def sqrt(x: float) -> float: ...
+def exp(x: int) -> float: ...
+def exp(x: float) -> float: ...
+def log(x: int) -> float: ...
+def log(x: float) -> float: ...
+def log(x: float, base: float) -> float: ...
+def log2(x: int) -> float: ...
+def log2(x: float) -> float: ...
+def log10(x: int) -> float: ...
+def log10(x: float) -> float: ...
+def pow(x: float, y: float) -> float: ...
+def sin(x: int) -> float: ...
+def sin(x: float) -> float: ...
+def cos(x: int) -> float: ...
+def cos(x: float) -> float: ...
+def tan(x: int) -> float: ...
+def tan(x: float) -> float: ...
+def atan2(y: float, x: float) -> float: ...
+def hypot(*xs: float) -> float: ...
+def isnan(x: float) -> bool: ...
+def isinf(x: float) -> bool: ...
+def isclose(a: float, b: float) -> bool: ...
+def gcd(*xs: int) -> int: ...
+def factorial(x: int) -> int: ...
+def comb(n: int, k: int) -> int: ...
@@ -0,0 +1,17 @@
+sep: str
+
+def join(path: str, *paths: str) -> str: ...
+def exists(path: str) -> bool: ...
+def isfile(path: str) -> bool: ...
+def isdir(path: str) -> bool: ...
+def basename(path: str) -> str: ...
+def dirname(path: str) -> str: ...
+def abspath(path: str) -> str: ...
+def realpath(path: str) -> str: ...
+def normpath(path: str) -> str: ...
+def expanduser(path: str) -> str: ...
+def relpath(path: str) -> str: ...
+def relpath(path: str, start: str) -> str: ...
+def splitext(path: str) -> Any: ...
+def split(path: str) -> Any: ...
+def getsize(path: str) -> int: ...
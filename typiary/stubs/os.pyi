@@ -0,0 +1,21 @@
+sep: str
+linesep: str
+name: str
+environ: {str: str}
+
+def getcwd() -> str: ...
+def chdir(path: str) -> None: ...
+def listdir() -> [str]: ...
+def listdir(path: str) -> [str]: ...
+def mkdir(path: str) -> None: ...
+def makedirs(path: str) -> None: ...
+def remove(path: str) -> None: ...
+def unlink(path: str) -> None: ...
+def rename(src: str, dst: str) -> None: ...
+def replace(src: str, dst: str) -> None: ...
+def getenv(key: str) -> Any: ...
+def getenv(key: str, default: Any) -> Any: ...
+def getpid() -> int: ...
+def cpu_count() -> Any: ...
+def walk(top: str) -> Any: ...
+def stat(path: str) -> Any: ...
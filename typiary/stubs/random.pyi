@@ -0,0 +1,10 @@
+def seed() -> None: ...
+def seed(a: Any) -> None: ...
+def random() -> float: ...
+def uniform(a: float, b: float) -> float: ...
+def randint(a: int, b: int) -> int: ...
+def randrange(stop: int) -> int: ...
+def randrange(start: int, stop: int) -> int: ...
+def choice(xs: Any) -> Any: ...
+def shuffle(xs: Any) -> None: ...
+def sample(xs: Any, k: int) -> [Any]: ...
@@ -0,0 +1,9 @@
+def compile(pattern: str) -> Any: ...
+def compile(pattern: str, flags: int) -> Any: ...
+def match(pattern: str, s: str) -> Any: ...
+def search(pattern: str, s: str) -> Any: ...
+def fullmatch(pattern: str, s: str) -> Any: ...
+def findall(pattern: str, s: str) -> [Any]: ...
+def sub(pattern: str, repl: Any, s: str) -> str: ...
+def split(pattern: str, s: str) -> [str]: ...
+def escape(s: str) -> str: ...
@@ -0,0 +1,10 @@
+ascii_letters: str
+ascii_lowercase: str
+ascii_uppercase: str
+digits: str
+hexdigits: str
+punctuation: str
+whitespace: str
+printable: str
+
+def capwords(s: str) -> str: ...
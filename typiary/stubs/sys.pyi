@@ -0,0 +1,14 @@
+argv: [str]
+path: [str]
+platform: str
+version: str
+maxsize: int
+stdin: Any
+stdout: Any
+stderr: Any
+modules: {str: Any}
+
+def exit() -> None: ...
+def exit(code: Any) -> None: ...
+def getrecursionlimit() -> int: ...
+def setrecursionlimit(limit: int) -> None: ...
@@ -0,0 +1,9 @@
+def time() -> float: ...
+def time_ns() -> int: ...
+def monotonic() -> float: ...
+def perf_counter() -> float: ...
+def process_time() -> float: ...
+def sleep(seconds: int) -> None: ...
+def sleep(seconds: float) -> None: ...
+def strftime(format: str) -> str: ...
+def strftime(format: str, t: Any) -> str: ...